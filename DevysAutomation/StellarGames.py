@@ -3,19 +3,16 @@ from PIL import Image, ImageTk, ImageGrab
 import threading
 import time
 import mss
-import math
 import json
 import glob
 import os
-import keyboard
-import cv2
-import numpy as np
-
-try:
-    import pydirectinput
-    pydirectinput.PAUSE = 0.05 
-except ImportError:
-    pydirectinput = None
+from frame_pipeline import FramePipeline
+from search_window import padded_region
+from matcher import MATCHERS
+from rules import compile_rules, RuleError, DEFAULT_INTERVAL_MS, DEFAULT_COOLDOWN_MS
+from template_store import TemplateStore
+from engine import AutomationEngine, DEFAULT_FPS
+from input_backends import DirectInputBackend
 
 class PixelAutomationApp(ctk.CTk):
     def __init__(self):
@@ -23,6 +20,8 @@ class PixelAutomationApp(ctk.CTk):
 
         self.running = False
         self.bot_thread = None
+        self.engine = None
+        self.templates = TemplateStore()
         
         self.active_rules = [] 
         self.selected_rule_index = None 
@@ -32,6 +31,8 @@ class PixelAutomationApp(ctk.CTk):
         self.start_y = 0
         self.rect_id = None
         self.capture_mode = "pixel"
+        self.capture_rect = None
+        self.search_region = None
 
         # 1. Window Setup
         self.title("Devy's Multi-Rule Automation")
@@ -51,9 +52,11 @@ class PixelAutomationApp(ctk.CTk):
         self.tabview.pack(padx=20, pady=10)
         self.tab_capture = self.tabview.add("1. Capture Ingredients")
         self.tab_logic = self.tabview.add("2. Build Logic Chain")
+        self.tab_profiler = self.tabview.add("3. Profiler")
 
         self.setup_capture_tab()
         self.setup_logic_tab()
+        self.setup_profiler_tab()
 
     # =======================================================
     # TAB 1: CAPTURE
@@ -78,6 +81,15 @@ class PixelAutomationApp(ctk.CTk):
         self.entry_Image = ctk.CTkEntry(img_row, placeholder_text="Path to image...", width=200, fg_color="#2b2b2b", text_color="white", border_color="#00FFFF")
         self.entry_Image.pack(side="left", padx=10)
         self.create_action_button(img_row, "Capture Region", lambda: self.start_overlay("image")).pack(side="left", padx=10)
+        self.create_action_button(img_row, "+ Add State", lambda: self.start_overlay("state")).pack(side="left", padx=10)
+        self.create_input_row(frame, "Scales:", "1.0 (e.g. 0.75, 1, 1.25)")
+
+        search_row = ctk.CTkFrame(frame, fg_color="transparent")
+        search_row.pack(anchor="w", pady=5)
+        ctk.CTkLabel(search_row, text="Area:", font=("Arial", 20, "bold"), text_color="#00FFFF", width=60, anchor="w").pack(side="left")
+        self.search_mode = ctk.CTkOptionMenu(search_row, values=["Full Screen", "Around Capture", "Picked Area", "Adaptive"], width=200)
+        self.search_mode.pack(side="left", padx=10)
+        self.create_action_button(search_row, "Pick Area", lambda: self.start_overlay("region")).pack(side="left", padx=10)
 
         # --- SAVE ---
         ctk.CTkLabel(frame, text="-- SAVE INGREDIENT --", text_color="gray").pack(anchor="w", pady=(20,0))
@@ -138,10 +150,38 @@ class PixelAutomationApp(ctk.CTk):
         
         ctk.CTkButton(controls, text="Add Action", width=80, fg_color="#00AA00", command=self.add_action_to_rule).pack(side="left", padx=5)
 
+        # Rule Timing (how often it is checked, rest after firing, who goes first)
+        timing = ctk.CTkFrame(right_col, fg_color="#333333", border_color="#00FFFF", border_width=1)
+        timing.pack(fill="x", pady=(0, 10))
+        self.timing_entries = {}
+        for key, label in (("interval_ms", "Every (ms)"), ("cooldown_ms", "Cooldown (ms)"), ("priority", "Priority")):
+            ctk.CTkLabel(timing, text=label, text_color="gray").pack(side="left", padx=(8, 2), pady=10)
+            entry = ctk.CTkEntry(timing, width=60)
+            entry.pack(side="left", padx=2, pady=10)
+            self.timing_entries[key] = entry
+        ctk.CTkButton(timing, text="Apply", width=60, fg_color="#00AA00", command=self.apply_rule_timing).pack(side="left", padx=8)
+
         # Action List Display
         self.action_scroll = ctk.CTkScrollableFrame(right_col, height=200, fg_color="#1a1a1a")
         self.action_scroll.pack(fill="both", expand=True)
 
+        # Matcher (accuracy/speed trade-off for image rules)
+        matcher_row = ctk.CTkFrame(right_col, fg_color="transparent")
+        matcher_row.pack(pady=(10, 0))
+        ctk.CTkLabel(matcher_row, text="Image Matcher:", text_color="gray").pack(side="left", padx=5)
+        self.matcher_mode = ctk.CTkOptionMenu(matcher_row, values=list(MATCHERS), width=150)
+        self.matcher_mode.set("Balanced")
+        self.matcher_mode.pack(side="left", padx=5)
+        self.parallel_switch = ctk.CTkSwitch(matcher_row, text="Parallel Detection")
+        self.parallel_switch.pack(side="left", padx=10)
+        self.static_switch = ctk.CTkSwitch(matcher_row, text="Skip Unchanged Areas")
+        self.static_switch.select()
+        self.static_switch.pack(side="left", padx=10)
+        ctk.CTkLabel(matcher_row, text="Max FPS:", text_color="gray").pack(side="left", padx=5)
+        self.fps_entry = ctk.CTkEntry(matcher_row, width=50)
+        self.fps_entry.insert(0, str(DEFAULT_FPS))
+        self.fps_entry.pack(side="left", padx=5)
+
         # START / STOP
         btn_frame = ctk.CTkFrame(right_col, fg_color="transparent")
         btn_frame.pack(pady=20)
@@ -152,6 +192,47 @@ class PixelAutomationApp(ctk.CTk):
 
         self.refresh_profiles()
 
+    # =======================================================
+    # TAB 3: PROFILER
+    # =======================================================
+    def setup_profiler_tab(self):
+        top = ctk.CTkFrame(self.tab_profiler, fg_color="transparent")
+        top.pack(fill="x", padx=20, pady=(20, 5))
+        self.fps_label = ctk.CTkLabel(top, text="Engine not running", font=("Arial", 18, "bold"), text_color="#00FFFF")
+        self.fps_label.pack(side="left")
+        self.create_action_button(top, "Export CSV", self.export_profile).pack(side="right")
+
+        self.profile_text = ctk.CTkTextbox(self.tab_profiler, font=("Courier New", 14), fg_color="#1a1a1a", text_color="white")
+        self.profile_text.pack(fill="both", expand=True, padx=20, pady=10)
+        self.profile_status = ctk.CTkLabel(self.tab_profiler, text="", text_color="yellow")
+        self.profile_status.pack(pady=(0, 10))
+        self.refresh_profiler()
+
+    def refresh_profiler(self):
+        # Reads the counters from the GUI thread; the engine only ever writes them
+        if self.engine and self.tabview.get() == "3. Profiler":
+            profiler = self.engine.profiler
+            state = "running" if self.engine.running else "stopped"
+            self.fps_label.configure(text=f"Loop: {profiler.fps():.1f} FPS ({state})")
+            lines = [f"{'Stage':<32}{'count':>8}{'last':>9}{'mean':>9}{'p95':>9}{'max':>9}  (ms)"]
+            for name, count, last, mean, p95, peak in profiler.summary():
+                lines.append(f"{name[:31]:<32}{count:>8}{last:>9.2f}{mean:>9.2f}{p95:>9.2f}{peak:>9.2f}")
+            if profiler.errors:
+                lines.append("\nErrors:")
+                lines += [f"  {where}: {count}" for where, count in profiler.errors.items()]
+                lines.append(f"  last: {profiler.last_error}")
+            self.profile_text.delete("1.0", "end")
+            self.profile_text.insert("1.0", "\n".join(lines))
+        self.after(500, self.refresh_profiler)
+
+    def export_profile(self):
+        if not self.engine:
+            self.profile_status.configure(text="Start the engine first")
+            return
+        path = f"profile_{time.strftime('%Y%m%d_%H%M%S')}.csv"
+        self.engine.profiler.export_csv(path)
+        self.profile_status.configure(text=f"Saved {path}")
+
     # =======================================================
     # LOGIC: MANAGING RULES
     # =======================================================
@@ -174,7 +255,10 @@ class PixelAutomationApp(ctk.CTk):
             new_rule = {
                 "name": filename,
                 "data": data, 
-                "actions": [] 
+                "actions": [],
+                "interval_ms": DEFAULT_INTERVAL_MS,
+                "cooldown_ms": DEFAULT_COOLDOWN_MS,
+                "priority": 0
             }
             self.active_rules.append(new_rule)
             self.render_rule_list()
@@ -209,8 +293,23 @@ class PixelAutomationApp(ctk.CTk):
     def select_rule(self, index):
         self.selected_rule_index = index
         self.editor_label.configure(text=f"Editing: {self.active_rules[index]['name']}", text_color="#00FFFF")
+        for key, entry in self.timing_entries.items():
+            entry.delete(0, "end"); entry.insert(0, str(self.active_rules[index][key]))
         self.render_action_list()
 
+    def apply_rule_timing(self):
+        if self.selected_rule_index is None: return
+        rule = self.active_rules[self.selected_rule_index]
+        try:
+            values = {key: float(entry.get()) for key, entry in self.timing_entries.items()}
+            if values["interval_ms"] < 0 or values["cooldown_ms"] < 0: raise ValueError
+        except ValueError:
+            self.editor_label.configure(text="Timing values must be non-negative numbers", text_color="#FF5555")
+            return
+        values["priority"] = int(values["priority"])
+        rule.update(values)
+        self.editor_label.configure(text=f"Editing: {rule['name']}", text_color="#00FFFF")
+
     # =======================================================
     # LOGIC: ACTIONS (Added Move Up/Down)
     # =======================================================
@@ -279,6 +378,23 @@ class PixelAutomationApp(ctk.CTk):
     # =======================================================
     def start_automation(self):
         if not self.active_rules: return
+        matcher = MATCHERS[self.matcher_mode.get()]
+        self.skip_static = self.static_switch.get() == 1
+        try:
+            fps = float(self.fps_entry.get())
+            if fps <= 0: raise ValueError
+        except ValueError:
+            self.editor_label.configure(text="Max FPS must be a positive number", text_color="#FF5555")
+            return
+
+        try:
+            rules, probes = compile_rules(self.active_rules, self.templates)
+        except RuleError as e:
+            self.editor_label.configure(text=f"Can't start: {e}", text_color="#FF5555")
+            return
+
+        self.engine = AutomationEngine(rules, probes, matcher, DirectInputBackend(),
+                                       parallel=self.parallel_switch.get() == 1, fps=fps)
         self.running = True
         self.start_btn.configure(state="disabled")
         self.stop_btn.configure(state="normal")
@@ -289,96 +405,14 @@ class PixelAutomationApp(ctk.CTk):
 
     def stop_automation(self):
         self.running = False
+        if self.engine: self.engine.stop()
         self.start_btn.configure(state="normal")
         self.stop_btn.configure(state="disabled")
 
     def automation_loop(self):
         print("Bot Started. Running Logic Chain...")
-        
-        # Pre-load all image templates
-        for rule in self.active_rules:
-            if rule['data'].get('type') == 'image':
-                path = rule['data']['image_path']
-                try:
-                    img = cv2.imread(path, 0)
-                    rule['template'] = img
-                    h, w = img.shape
-                    rule['size'] = (w, h)
-                except:
-                    print(f"Failed to load image: {path}")
-
         with mss.mss() as sct:
-            while self.running:
-                for rule in self.active_rules:
-                    found = False
-                    found_x, found_y = 0, 0
-                    data = rule['data']
-
-                    # --- PIXEL CHECK ---
-                    if data.get('type') == 'pixel':
-                        try:
-                            monitor = {"top": int(data["y"]), "left": int(data["x"]), "width": 1, "height": 1}
-                            img = sct.grab(monitor)
-                            pixel = img.pixel(0, 0)
-                            target = list(map(int, data["rgb"].split(',')))
-                            diff = math.sqrt(sum((a - b) ** 2 for a, b in zip(pixel, target)))
-                            if diff < 20:
-                                found = True
-                                found_x, found_y = int(data["x"]), int(data["y"])
-                        except: pass
-
-                    # --- IMAGE CHECK ---
-                    elif data.get('type') == 'image' and 'template' in rule:
-                        try:
-                            monitor = sct.monitors[1]
-                            sct_img = np.array(sct.grab(monitor))
-                            gray_screen = cv2.cvtColor(sct_img, cv2.COLOR_BGRA2GRAY)
-                            res = cv2.matchTemplate(gray_screen, rule['template'], cv2.TM_CCOEFF_NORMED)
-                            loc = np.where(res >= 0.8) 
-                            
-                            if len(loc[0]) > 0:
-                                found = True
-                                pt = list(zip(*loc[::-1]))[0] 
-                                w, h = rule['size']
-                                found_x = int(pt[0] + w/2)
-                                found_y = int(pt[1] + h/2)
-                        except: pass
-
-                    # --- EXECUTE ACTIONS ---
-                    if found:
-                        print(f"Rule '{rule['name']}' matched! Executing actions...")
-                        for action in rule['actions']:
-                            atype = action['type']
-                            aval = action['value']
-
-                            if atype == "Press Key":
-                                if pydirectinput: pydirectinput.press(aval)
-                            
-                            elif atype == "Type Text":
-                                try: keyboard.write(str(aval), delay=0.05)
-                                except: pass
-                            
-                            elif atype == "Wait (ms)":
-                                time.sleep(float(aval) / 1000)
-                            
-                            elif atype == "Click Found Spot":
-                                if pydirectinput:
-                                    pydirectinput.moveTo(found_x, found_y)
-                                    pydirectinput.click()
-
-                            elif atype == "Click Custom (X,Y)":
-                                try:
-                                    coords = aval.split(',')
-                                    cx = int(coords[0].strip())
-                                    cy = int(coords[1].strip())
-                                    if pydirectinput:
-                                        pydirectinput.moveTo(cx, cy)
-                                        pydirectinput.click()
-                                except: print("Invalid Coords")
-                        
-                        time.sleep(0.5)
-
-                time.sleep(0.1)
+            self.engine.run(FramePipeline(sct, sct.monitors[1], track_changes=self.skip_static))
 
     # =======================================================
     # OVERLAYS & FILE SAVING
@@ -415,6 +449,7 @@ class PixelAutomationApp(ctk.CTk):
         self.entry_Y.delete(0, "end"); self.entry_Y.insert(0, str(y))
         self.entry_RGB.delete(0, "end"); self.entry_RGB.insert(0, f"{rgb[0]}, {rgb[1]}, {rgb[2]}")
         self.entry_Image.delete(0, "end")
+        self.capture_rect = None
 
     def on_drag_start(self, event):
         self.start_x, self.start_y = event.x, event.y
@@ -428,19 +463,57 @@ class PixelAutomationApp(ctk.CTk):
         self.deiconify()
         x1, y1 = min(self.start_x, event.x), min(self.start_y, event.y)
         x2, y2 = max(self.start_x, event.x), max(self.start_y, event.y)
+        if self.capture_mode == "region":
+            self.search_region = [x1, y1, x2, y2]
+            self.search_mode.set("Picked Area")
+            return
+
         crop = self.screenshot_img.crop((x1, y1, x2, y2))
         if not os.path.exists("images"): os.makedirs("images")
-        filename = f"images/cap_{int(time.time())}.png"
+        filename = f"images/cap_{int(time.time() * 1000)}.png"
         crop.save(filename)
-        self.entry_Image.delete(0, "end"); self.entry_Image.insert(0, filename)
+
+        # "+ Add State" appends another look of the same element to this detector
+        if self.capture_mode == "state" and self.entry_Image.get():
+            self.entry_Image.insert("end", f"; {filename}")
+            if self.capture_rect:
+                cx1, cy1, cx2, cy2 = self.capture_rect
+                self.capture_rect = (min(cx1, x1), min(cy1, y1), max(cx2, x2), max(cy2, y2))
+            else:
+                self.capture_rect = (x1, y1, x2, y2)
+        else:
+            self.capture_rect = (x1, y1, x2, y2)
+            self.entry_Image.delete(0, "end"); self.entry_Image.insert(0, filename)
         self.entry_X.delete(0, "end"); self.entry_Y.delete(0, "end"); self.entry_RGB.delete(0, "end")
 
     def save_new_profile(self):
         name = self.entry_Name.get()
         if not name: return
-        image_path = self.entry_Image.get()
-        if image_path:
-            data = {"type": "image", "image_path": image_path}
+        image_paths = [p.strip() for p in self.entry_Image.get().split(";") if p.strip()]
+        if image_paths:
+            if len(image_paths) == 1:
+                data = {"type": "image", "image_path": image_paths[0]}
+            else:
+                data = {"type": "image", "image_paths": image_paths}
+
+            scales_text = self.entry_Scales.get().strip()
+            if scales_text:
+                try:
+                    scales = [float(s) for s in scales_text.split(",")]
+                    if any(s <= 0 for s in scales): raise ValueError
+                except ValueError:
+                    self.save_status.configure(text="Scales must be positive numbers, e.g. 0.75, 1, 1.25", text_color="#FF5555")
+                    return
+                if scales != [1.0]:
+                    data["scales"] = scales
+
+            mode = self.search_mode.get()
+            if mode == "Picked Area" and self.search_region:
+                data["region"] = self.search_region
+            elif mode in ("Around Capture", "Adaptive") and self.capture_rect:
+                data["region"] = padded_region(*self.capture_rect)
+            if mode == "Adaptive":
+                data["search"] = "adaptive"
         else:
             data = {"type": "pixel", "x": self.entry_X.get(), "y": self.entry_Y.get(), "rgb": self.entry_RGB.get()}
         
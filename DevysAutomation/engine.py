@@ -0,0 +1,274 @@
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import cv2
+from matcher import build_pyramid
+from profiler import Profiler
+from rules import PixelRule, ImageRule, PIXEL_TOLERANCE, PRESS_KEY, TYPE_TEXT, WAIT, CLICK_FOUND, CLICK_AT
+
+DEFAULT_FPS = 10  # Max screen captures per second
+EPSILON = 1e-9    # Slack for float clock comparisons
+
+
+class ActionRun:
+    """A rule's action sequence in progress. WAIT actions park it until `resume_at`."""
+
+    __slots__ = ("rule", "spot", "index", "resume_at")
+
+    def __init__(self, rule, spot):
+        self.rule = rule
+        self.spot = spot
+        self.index = 0
+        self.resume_at = 0.0
+
+
+class AutomationEngine:
+    """
+    Detection and action engine, independent of the GUI, mss and pydirectinput.
+
+    Frames come from a FrameSource (the live FramePipeline or a replay source)
+    and actions go to an input backend, so the same chain can run headlessly.
+
+    Each rule is checked every `interval` seconds, is left alone while its
+    actions run, and rests for `cooldown` afterwards. A frame is only captured
+    when some rule is due, and never more than `fps` times a second. Waits
+    inside an action sequence are timers, so other rules keep being detected
+    in the meantime. Rules that match on the same frame start their actions
+    by priority (highest first), then chain order.
+    """
+
+    def __init__(self, rules, probes, matcher, inputs, parallel=False, fps=DEFAULT_FPS):
+        self.rules = rules
+        self.probes = probes
+        self.matcher = matcher
+        self.inputs = inputs
+        self.frame_budget = 1 / fps
+        self.clock = time.monotonic
+        self.verbose = True
+        self.profiler = Profiler()
+        self.on_detect = None  # Optional hook, called as on_detect(rule, seconds, spot)
+
+        self.runs = []
+        self.last_grab = float("-inf")
+        self._stopped = threading.Event()
+
+        self.workers = None
+        image_rules = sum(1 for r in rules if isinstance(r, ImageRule))
+        if parallel and image_rules > 1:
+            self.workers = ThreadPoolExecutor(max_workers=min(image_rules, os.cpu_count() or 1))
+
+    @property
+    def running(self):
+        return not self._stopped.is_set()
+
+    def run(self, source):
+        try:
+            while self.running:
+                self.step(source)
+                self._stopped.wait(max(0.0, self.next_wakeup() - self.clock()))
+        finally:
+            self.close()
+
+    def stop(self):
+        self._stopped.set()
+
+    def close(self):
+        if self.workers: self.workers.shutdown(wait=False)
+
+    def next_wakeup(self):
+        """Clock time at which step() next has something to do."""
+        idle = [r.due for r in self.rules if not r.busy]
+        detect_at = max(min(idle), self.last_grab + self.frame_budget) if idle else float("inf")
+        resume_at = min((run.resume_at for run in self.runs), default=float("inf"))
+        wake = min(detect_at, resume_at)
+        # Nothing scheduled (every rule busy with no timer) should not happen, but never sleep forever
+        return wake if wake != float("inf") else self.clock() + self.frame_budget
+
+    def step(self, source, now=None):
+        """
+        Resumes due action sequences and checks due rules on one frame. Matched rules
+        start in priority order; once one of them sends input, the rest are checked
+        again on a fresh frame, since that input may have changed the screen.
+        Returns the rules that fired.
+        """
+        now = self.clock() if now is None else now
+        for run in [r for r in self.runs if r.resume_at <= now + EPSILON]:
+            self.continue_run(run, now)
+
+        if now + EPSILON < self.last_grab + self.frame_budget:
+            return []
+        due = [r for r in self.rules if not r.busy and r.due <= now + EPSILON]
+        if not due:
+            return []
+
+        self.last_grab = now
+        start = time.perf_counter()
+        spots = self.detect_all(due, self.grab(source), source)
+
+        fired = []
+        for rule, spot in zip(due, spots):
+            rule.due = now + rule.interval
+            if spot: fired.append((rule, spot))
+
+        # sort() is stable, so equal priorities keep chain order
+        fired.sort(key=lambda f: -f[0].priority)
+        started = []
+        while fired and self.running:
+            rule, spot = fired.pop(0)
+            started.append(rule)
+            if self.start_run(rule, spot, now) and fired:
+                rules = [r for r, _ in fired]
+                fired = [(r, s) for r, s in zip(rules, self.detect_all(rules, self.grab(source), source)) if s]
+        self.profiler.record("step", time.perf_counter() - start)
+        return started
+
+    def grab(self, source):
+        start = time.perf_counter()
+        frame = source.grab()
+        self.profiler.grabbed()
+        self.profiler.record("capture", time.perf_counter() - start)
+        return frame
+
+    def detect_all(self, rules, frame, source):
+        if not self.workers:
+            return [self.detect(rule, frame, source) for rule in rules]
+        # Image matching releases the GIL; pixel checks stay here because mss is not thread-safe
+        pending = {i: self.workers.submit(self.detect, rule, frame, source)
+                   for i, rule in enumerate(rules) if isinstance(rule, ImageRule)}
+        return [pending[i].result() if i in pending else self.detect(rule, frame, source)
+                for i, rule in enumerate(rules)]
+
+    # =======================================================
+    # DETECTION
+    # =======================================================
+    def detect(self, rule, frame, source):
+        """Returns the (x, y) screen spot where the rule matched, or None."""
+        start = time.perf_counter()
+        try:
+            if isinstance(rule, PixelRule):
+                spot = self.detect_pixel(rule, frame, source)
+            else:
+                spot = self.detect_image(rule, frame, source)
+        except Exception as e:
+            self.profiler.error(f"detect {rule.name}", e)
+            spot = None
+        elapsed = time.perf_counter() - start
+        self.profiler.record(f"match: {rule.name}", elapsed)
+        if self.on_detect:
+            self.on_detect(rule, elapsed, spot)
+        return spot
+
+    def gray(self, frame):
+        return frame.view("gray", self._convert)
+
+    def _convert(self, frame):
+        start = time.perf_counter()
+        gray = cv2.cvtColor(frame.bgra, cv2.COLOR_BGRA2GRAY)
+        self.profiler.record("convert", time.perf_counter() - start)
+        return gray
+
+    def pixel_mask(self, frame):
+        """Match state of every pixel rule on this frame, computed once and shared."""
+        return frame.view("pixel_mask", self._check_pixels)
+
+    def _check_pixels(self, frame):
+        start = time.perf_counter()
+        mask = self.probes.check(frame)
+        self.profiler.record("pixels", time.perf_counter() - start)
+        return mask
+
+    def detect_pixel(self, rule, frame, source):
+        x, y = rule.x, rule.y
+        if frame.contains(x, y):
+            return (x, y) if self.pixel_mask(frame)[rule.probe] else None
+
+        rgb = source.pixel(frame, x, y)
+        if rgb is None: return None
+        r, g, b = rgb
+        tr, tg, tb = rule.rgb
+        return (x, y) if (r - tr) ** 2 + (g - tg) ** 2 + (b - tb) ** 2 < PIXEL_TOLERANCE ** 2 else None
+
+    def reusable(self, rule, rect, source):
+        """True if the rule's last result was for `rect` and nothing inside it has changed since."""
+        cache = rule.cache
+        return cache is not None and cache[0] == rect and source.unchanged(rect, cache[1])
+
+    def detect_image(self, rule, frame, source):
+        narrowed = rule.window.narrowed
+        spot = self.match_window(rule, frame, source)
+        if spot is None and narrowed:
+            # The element moved out of the adaptive window; look for it in the full region on this frame
+            spot = self.match_window(rule, frame, source)
+        return spot
+
+    def match_window(self, rule, frame, source):
+        w, h, window = rule.w, rule.h, rule.window
+        rect = window.rect(frame, w, h)
+        if self.reusable(rule, rect, source):
+            return rule.cache[2]
+
+        search, (ox, oy) = window.crop(self.gray(frame), frame, w, h)
+        # Full-screen rules share one downscaled copy of the frame
+        pyramid = None
+        if self.matcher.levels and rect == (0, 0, frame.width, frame.height):
+            pyramid = frame.view(("pyramid", self.matcher.levels), lambda f: build_pyramid(self.gray(f), self.matcher.levels))
+        found = self.matcher.match_many(search, rule.variants, pyramid=pyramid)
+
+        spot = None
+        if found:
+            i, hit = found
+            vw, vh = rule.variants[i].w, rule.variants[i].h
+            left, top = frame.left + ox + hit.x, frame.top + oy + hit.y
+            window.hit(left, top, vw, vh)
+            spot = int(left + vw/2), int(top + vh/2)
+            rule.best = (rule.labels[i], hit.score)
+        else:
+            window.miss()
+        rule.cache = (rect, frame.seq, spot)
+        return spot
+
+    # =======================================================
+    # ACTIONS
+    # =======================================================
+    def start_run(self, rule, spot, now):
+        """Starts the rule's actions. Returns True if any input was sent before the first wait."""
+        if self.verbose: print(f"Rule '{rule.name}' matched! Executing actions...")
+        rule.busy = True
+        run = ActionRun(rule, spot)
+        self.runs.append(run)
+        return self.continue_run(run, now)
+
+    def continue_run(self, run, now):
+        """Performs actions until the sequence ends or reaches a wait. Returns True if any were performed."""
+        actions = run.rule.actions
+        acted = False
+        while run.index < len(actions):
+            action = actions[run.index]
+            run.index += 1
+            if action.op == WAIT:
+                run.resume_at = now + action.arg
+                return acted
+            acted = True
+            start = time.perf_counter()
+            try:
+                self.perform(action, run.spot)
+            except Exception as e:
+                self.profiler.error(f"action {run.rule.name}", e)
+            self.profiler.record("action", time.perf_counter() - start)
+
+        self.runs.remove(run)
+        run.rule.busy = False
+        run.rule.due = now + run.rule.cooldown
+        return acted
+
+    def perform(self, action, spot):
+        op, arg = action.op, action.arg
+        if op == PRESS_KEY:
+            self.inputs.press(arg)
+        elif op == TYPE_TEXT:
+            self.inputs.write(arg)
+        elif op == CLICK_FOUND:
+            self.inputs.click(*spot)
+        elif op == CLICK_AT:
+            self.inputs.click(*arg)
@@ -0,0 +1,123 @@
+import threading
+import cv2
+import numpy as np
+
+CHANGE_BLOCK = 32  # Side of the square blocks the change tracker compares, in pixels
+
+
+class Frame:
+    """One monitor capture, shared by every rule evaluated in a tick."""
+
+    def __init__(self, bgra, left=0, top=0):
+        self.bgra = bgra
+        self.left = left
+        self.top = top
+        self.height, self.width = bgra.shape[:2]
+        self.seq = 0
+        self._views = {}
+        self._lock = threading.Lock()
+
+    def view(self, key, build):
+        """Returns a derived view of the frame, building it on first use."""
+        view = self._views.get(key)
+        if view is None:
+            with self._lock:
+                view = self._views.get(key)
+                if view is None:
+                    view = build(self)
+                    self._views[key] = view
+        return view
+
+    @property
+    def gray(self):
+        return self.view("gray", lambda f: cv2.cvtColor(f.bgra, cv2.COLOR_BGRA2GRAY))
+
+    def contains(self, x, y):
+        return 0 <= x - self.left < self.width and 0 <= y - self.top < self.height
+
+    def pixel(self, x, y):
+        """RGB at screen coordinates (x, y)."""
+        b, g, r = self.bgra[y - self.top, x - self.left, :3]
+        return int(r), int(g), int(b)
+
+
+class ChangeTracker:
+    """
+    Remembers, per block of the screen, the last frame in which it changed.
+
+    A result computed on frame `seq` is still valid for a region as long as no
+    block overlapping that region has changed since.
+    """
+
+    def __init__(self, block=CHANGE_BLOCK):
+        self.block = block
+        self.stamps = None
+        self._previous = None
+
+    def update(self, frame):
+        prev, self._previous = self._previous, frame.bgra
+        if prev is None or prev.shape != frame.bgra.shape:
+            rows = -(-frame.height // self.block); cols = -(-frame.width // self.block)
+            self.stamps = np.full((rows, cols), frame.seq, dtype=np.int64)
+            return
+
+        # Identical captures (menus, loading screens) stop at a single memcmp
+        if np.array_equal(prev, frame.bgra):
+            return
+
+        # One uint32 per BGRA pixel, so any channel change shows up as non-zero
+        diff = cv2.absdiff(prev, frame.bgra).view(np.uint32)[..., 0]
+        diff = np.maximum.reduceat(diff, np.arange(0, frame.height, self.block), axis=0)
+        diff = np.maximum.reduceat(diff, np.arange(0, frame.width, self.block), axis=1)
+        self.stamps[diff > 0] = frame.seq
+
+    def unchanged(self, rect, since):
+        """True if no block touching rect (frame coordinates) changed after frame `since`."""
+        x1, y1, x2, y2 = rect
+        b = self.block
+        return self.stamps[y1 // b:-(-y2 // b), x1 // b:-(-x2 // b)].max(initial=0) <= since
+
+
+class FrameSource:
+    """Numbers captured frames and, optionally, tracks what changed between them."""
+
+    def __init__(self, track_changes=False):
+        self.changes = ChangeTracker() if track_changes else None
+        self._seq = 0
+
+    def capture(self):
+        raise NotImplementedError
+
+    def grab(self):
+        frame = self.capture()
+        self._seq += 1
+        frame.seq = self._seq
+        if self.changes: self.changes.update(frame)
+        return frame
+
+    def unchanged(self, rect, since):
+        return self.changes is not None and self.changes.unchanged(rect, since)
+
+    def pixel(self, frame, x, y):
+        """RGB at screen (x, y), or None if this source cannot see that spot."""
+        return frame.pixel(x, y) if frame.contains(x, y) else None
+
+
+class FramePipeline(FrameSource):
+    """Captures the monitor once per tick instead of once per rule."""
+
+    def __init__(self, sct, monitor, track_changes=False):
+        super().__init__(track_changes)
+        self.sct = sct
+        self.monitor = monitor
+
+    def capture(self):
+        shot = self.sct.grab(self.monitor)
+        return Frame(np.asarray(shot), self.monitor["left"], self.monitor["top"])
+
+    def pixel(self, frame, x, y):
+        # Pixels on other monitors still need their own 1x1 grab
+        if frame.contains(x, y):
+            return frame.pixel(x, y)
+        img = self.sct.grab({"top": y, "left": x, "width": 1, "height": 1})
+        return img.pixel(0, 0)
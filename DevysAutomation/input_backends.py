@@ -0,0 +1,45 @@
+# Both are Windows input libraries: off Windows they can fail with more than ImportError
+# (pydirectinput touches ctypes.windll on import, keyboard wants root on Linux), and
+# RecordingBackend must still import there
+try:
+    import keyboard
+except Exception:
+    keyboard = None
+
+try:
+    import pydirectinput
+    pydirectinput.PAUSE = 0.05
+except Exception:
+    pydirectinput = None
+
+
+class DirectInputBackend:
+    """Real mouse and keyboard input. pydirectinput is used because DirectX games ignore normal input."""
+
+    def press(self, key):
+        if pydirectinput: pydirectinput.press(key)
+
+    def write(self, text):
+        try: keyboard.write(text, delay=0.05)
+        except Exception as e: print(f"Failed to type text: {e}")
+
+    def click(self, x, y):
+        if pydirectinput:
+            pydirectinput.moveTo(x, y)
+            pydirectinput.click()
+
+
+class RecordingBackend:
+    """Records every input instead of sending it, so replays run without touching the real mouse and keyboard."""
+
+    def __init__(self):
+        self.events = []
+
+    def press(self, key):
+        self.events.append(("press", key))
+
+    def write(self, text):
+        self.events.append(("write", text))
+
+    def click(self, x, y):
+        self.events.append(("click", x, y))
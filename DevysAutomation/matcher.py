@@ -0,0 +1,136 @@
+from collections import namedtuple
+import cv2
+import numpy as np
+
+MATCH_THRESHOLD = 0.8
+MIN_PYRAMID_SIZE = 8    # Templates are never shrunk below this many pixels per side
+MAX_PYRAMID_LEVELS = 3  # Deepest level any preset uses; the template store builds this many
+
+Match = namedtuple("Match", ["x", "y", "score"])  # Top-left corner in image coordinates
+
+
+class PreparedTemplate:
+    """A grayscale template plus its downscaled pyramid levels."""
+
+    def __init__(self, image, levels=0, pyramid=None):
+        self.image = image
+        self.h, self.w = image.shape[:2]
+        self.pyramid = pyramid or [image]
+        while len(self.pyramid) <= levels:
+            smaller = cv2.pyrDown(self.pyramid[-1])
+            if min(smaller.shape[:2]) < MIN_PYRAMID_SIZE: break
+            self.pyramid.append(smaller)
+
+    @property
+    def nbytes(self):
+        return sum(level.nbytes for level in self.pyramid)
+
+
+def build_pyramid(image, levels):
+    pyramid = [image]
+    for _ in range(levels):
+        pyramid.append(cv2.pyrDown(pyramid[-1]))
+    return pyramid
+
+
+def best_match(image, template):
+    """Argmax of TM_CCOEFF_NORMED as a Match, or None if the template does not fit."""
+    if image.shape[0] < template.shape[0] or image.shape[1] < template.shape[1]:
+        return None
+    res = cv2.matchTemplate(image, template, cv2.TM_CCOEFF_NORMED)
+    _, score, _, (x, y) = cv2.minMaxLoc(res)
+    return Match(x, y, score)
+
+
+class Matcher:
+    levels = 0
+
+    def match_many(self, image, variants, threshold=MATCH_THRESHOLD, pyramid=None):
+        """
+        Matches several templates (states/scales of one rule) against the same image.
+
+        The image pyramid is built once and shared by every variant. Returns
+        (variant index, Match) for the best-scoring variant, or None.
+        """
+        if pyramid is None and self.levels:
+            pyramid = build_pyramid(image, self.levels)
+        best = None
+        for i, prepared in enumerate(variants):
+            hit = self.match(image, prepared, threshold, pyramid)
+            if hit and (best is None or hit.score > best[1].score):
+                best = (i, hit)
+        return best
+
+
+class ExhaustiveMatcher(Matcher):
+    """Single full-resolution pass over the whole search image."""
+
+    def prepare(self, template):
+        return PreparedTemplate(template)
+
+    def match(self, image, prepared, threshold=MATCH_THRESHOLD, pyramid=None):
+        hit = best_match(image, prepared.image)
+        return hit if hit and hit.score >= threshold else None
+
+
+class PyramidMatcher(Matcher):
+    """
+    Coarse-to-fine matcher.
+
+    Matches on an image downscaled `levels` times, keeps the best `candidates`
+    coarse peaks scoring at least `coarse_threshold`, then refines each one at
+    full resolution inside a small neighbourhood. More levels and fewer
+    candidates are faster; fewer levels and more candidates are more accurate.
+    """
+
+    def __init__(self, levels=2, candidates=3, coarse_threshold=0.5):
+        self.levels = levels
+        self.candidates = candidates
+        self.coarse_threshold = coarse_threshold
+
+    def prepare(self, template):
+        return PreparedTemplate(template, self.levels)
+
+    def match(self, image, prepared, threshold=MATCH_THRESHOLD, pyramid=None):
+        """`pyramid` is an optional, already downscaled copy of `image` (see build_pyramid)."""
+        # Shared templates may carry more levels than this preset uses
+        levels = min(self.levels, len(prepared.pyramid) - 1)
+        if levels == 0:
+            return ExhaustiveMatcher().match(image, prepared, threshold)
+
+        if pyramid is None or len(pyramid) <= levels:
+            pyramid = build_pyramid(image, levels)
+        small = pyramid[levels]
+        coarse_t = prepared.pyramid[levels]
+        if small.shape[0] < coarse_t.shape[0] or small.shape[1] < coarse_t.shape[1]:
+            return ExhaustiveMatcher().match(image, prepared, threshold)
+
+        res = cv2.matchTemplate(small, coarse_t, cv2.TM_CCOEFF_NORMED)
+        ch, cw = coarse_t.shape[:2]
+        scale = 2 ** levels
+        pad = 2 * scale
+        best = None
+
+        for _ in range(self.candidates):
+            _, score, _, (cx, cy) = cv2.minMaxLoc(res)
+            if score < self.coarse_threshold: break
+            # Suppress this peak so the next minMaxLoc finds a different one
+            res[max(0, cy - ch // 2):cy + ch // 2 + 1, max(0, cx - cw // 2):cx + cw // 2 + 1] = -1
+
+            x0 = max(0, cx * scale - pad); y0 = max(0, cy * scale - pad)
+            x1 = min(image.shape[1], cx * scale + pad + prepared.w)
+            y1 = min(image.shape[0], cy * scale + pad + prepared.h)
+            hit = best_match(image[y0:y1, x0:x1], prepared.image)
+            if hit and (best is None or hit.score > best.score):
+                best = Match(x0 + hit.x, y0 + hit.y, hit.score)
+
+        return best if best and best.score >= threshold else None
+
+
+# Accuracy/speed presets selectable from the Logic tab
+MATCHERS = {
+    "Exhaustive": ExhaustiveMatcher(),
+    "Accurate": PyramidMatcher(levels=1, candidates=5, coarse_threshold=0.4),
+    "Balanced": PyramidMatcher(levels=2, candidates=3, coarse_threshold=0.5),
+    "Fast": PyramidMatcher(levels=3, candidates=1, coarse_threshold=0.6),
+}
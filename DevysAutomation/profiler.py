@@ -0,0 +1,81 @@
+import csv
+import threading
+import time
+import numpy as np
+
+SAMPLES = 600  # Samples kept per series (about a minute at 10 FPS)
+
+
+class RingBuffer:
+    """Fixed-size float buffer; recording is O(1) and never allocates."""
+
+    def __init__(self, size=SAMPLES):
+        self.values = np.zeros(size)
+        self.count = 0
+
+    def add(self, value):
+        self.values[self.count % len(self.values)] = value
+        self.count += 1
+
+    def last(self):
+        return self.values[(self.count - 1) % len(self.values)] if self.count else 0.0
+
+    def window(self):
+        return self.values[:min(self.count, len(self.values))]
+
+
+class Profiler:
+    """
+    Timing counters for the engine's hot path: capture, convert, match (per rule),
+    action and whole-step times in milliseconds, plus capture rate and error counts.
+    """
+
+    def __init__(self, size=SAMPLES):
+        self.size = size
+        self.series = {}
+        self.errors = {}
+        self.last_error = ""
+        self.grabs = RingBuffer(size)  # perf_counter timestamps of captures
+        self._lock = threading.Lock()
+
+    def record(self, name, seconds):
+        buf = self.series.get(name)
+        if buf is None:
+            with self._lock:
+                buf = self.series.setdefault(name, RingBuffer(self.size))
+        buf.add(seconds * 1000)
+
+    def grabbed(self):
+        self.grabs.add(time.perf_counter())
+
+    def error(self, where, exc):
+        with self._lock:
+            first = where not in self.errors
+            self.errors[where] = self.errors.get(where, 0) + 1
+            self.last_error = f"{where}: {exc}"
+        if first: print(f"Error in {where}: {exc}")
+
+    def fps(self):
+        stamps = np.sort(self.grabs.window())
+        if len(stamps) < 2 or stamps[-1] == stamps[0]: return 0.0
+        return (len(stamps) - 1) / (stamps[-1] - stamps[0])
+
+    def summary(self):
+        """One (series, samples, last, mean, p95, max) row per series, in ms."""
+        rows = []
+        for name, buf in list(self.series.items()):
+            w = buf.window()
+            if not len(w): continue
+            rows.append((name, buf.count, buf.last(), w.mean(), np.percentile(w, 95), w.max()))
+        return rows
+
+    def export_csv(self, path):
+        with open(path, "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(["series", "samples", "last_ms", "mean_ms", "p95_ms", "max_ms"])
+            for name, count, last, mean, p95, peak in self.summary():
+                writer.writerow([name, count, f"{last:.3f}", f"{mean:.3f}", f"{p95:.3f}", f"{peak:.3f}"])
+            writer.writerow([])
+            writer.writerow(["fps", f"{self.fps():.2f}"])
+            for where, count in self.errors.items():
+                writer.writerow(["errors", where, count])
@@ -0,0 +1,233 @@
+"""
+Headless replay and benchmark harness for the automation engine.
+
+Runs saved detector profiles against recorded PNG frames (or synthetic frames)
+with a recording input backend, then reports per-rule detection latency,
+frames per second and match accuracy. Needs no display, mss or pydirectinput.
+
+Usage:
+    python replay.py start_btn.json health_low.json --frames recordings/
+    python replay.py *.json --synthetic 300 --matcher Fast --parallel
+"""
+import argparse
+import glob
+import json
+import os
+import time
+import cv2
+import numpy as np
+from engine import AutomationEngine, DEFAULT_FPS
+from frame_pipeline import Frame, FrameSource
+from input_backends import RecordingBackend
+from matcher import MATCHERS, ExhaustiveMatcher
+from rules import compile_rules, ImageRule, PixelRule, RuleError, PIXEL_TOLERANCE
+from search_window import SearchWindow
+from template_store import TemplateStore
+
+SPOT_TOLERANCE = 3  # Pixels a detected spot may be off from the expected one and still count as correct
+
+
+def to_bgra(img):
+    if img.ndim == 2:
+        return cv2.cvtColor(img, cv2.COLOR_GRAY2BGRA)
+    if img.shape[2] == 3:
+        return cv2.cvtColor(img, cv2.COLOR_BGR2BGRA)
+    return img
+
+
+class ImageFolderSource(FrameSource):
+    """Replays every PNG in a folder, in name order. Ground truth is unknown."""
+
+    def __init__(self, folder, track_changes=False):
+        super().__init__(track_changes)
+        self.paths = sorted(glob.glob(os.path.join(folder, "*.png")))
+        self.index = -1
+        self.current = None
+        self.truth = None
+
+    def __len__(self):
+        return len(self.paths)
+
+    def advance(self):
+        self.index += 1
+        if self.index >= len(self.paths): return False
+        self.current = to_bgra(cv2.imread(self.paths[self.index], cv2.IMREAD_UNCHANGED))
+        return True
+
+    def capture(self):
+        # Re-grabs within a pass see the same recorded screen
+        return Frame(self.current)
+
+
+class SyntheticSource(FrameSource):
+    """
+    Generates frames from the rules themselves: one variant of each image rule
+    is pasted (inside its search region) and each pixel is set to its target colour about
+    half of the time, so the expected spot of every rule is known. Some frames
+    repeat the previous one to exercise the unchanged-area gating.
+    """
+
+    def __init__(self, rules, count, width=1920, height=1080, seed=0, track_changes=False):
+        super().__init__(track_changes)
+        self.rules = rules
+        self.count = count
+        self.width, self.height = width, height
+        self.rng = np.random.default_rng(seed)
+        noise = self.rng.integers(0, 256, (height, width, 3), dtype=np.uint8)
+        self.background = to_bgra(cv2.GaussianBlur(noise, (9, 9), 0))
+        self.index = -1
+        self.current = None
+        self.truth = None
+
+    def __len__(self):
+        return self.count
+
+    def advance(self):
+        self.index += 1
+        if self.index >= self.count: return False
+        if self.current is not None and self.rng.random() < 0.3:
+            return True
+
+        img = self.background.copy()
+        truth = {}
+        for rule in self.rules:
+            truth[rule.name] = None
+            if isinstance(rule, ImageRule) and self.rng.random() < 0.5:
+                variant = rule.variants[self.rng.integers(len(rule.variants))]
+                l, t, r, b = rule.window.region or (0, 0, self.width, self.height)
+                r, b = min(r, self.width), min(b, self.height)
+                if r - l < variant.w or b - t < variant.h: continue
+                x = int(self.rng.integers(l, r - variant.w + 1)); y = int(self.rng.integers(t, b - variant.h + 1))
+                img[y:y + variant.h, x:x + variant.w, :3] = variant.image[..., None]
+                truth[rule.name] = (x + variant.w // 2, y + variant.h // 2)
+
+        # Pixels go last so a pasted template cannot overwrite them
+        for rule in self.rules:
+            if isinstance(rule, PixelRule) and 0 <= rule.x < self.width and 0 <= rule.y < self.height:
+                if self.rng.random() < 0.5:
+                    img[rule.y, rule.x, :3] = rule.rgb[::-1]
+                    truth[rule.name] = (rule.x, rule.y)
+                else:
+                    img[rule.y, rule.x, :3] = [255 - c for c in rule.rgb[::-1]]
+
+        self.current = img
+        self.truth = truth
+        return True
+
+    def capture(self):
+        return Frame(self.current)
+
+
+class RuleStats:
+    def __init__(self):
+        self.times = []
+        self.evaluated = 0
+        self.hits = 0
+        self.correct = 0
+
+
+def expected_spot(rule, frame, reference):
+    """Spot the exhaustive matcher finds inside the rule's full search region (used when truth is unknown)."""
+    if isinstance(rule, PixelRule):
+        if not frame.contains(rule.x, rule.y): return None
+        r, g, b = frame.pixel(rule.x, rule.y)
+        tr, tg, tb = rule.rgb
+        return (rule.x, rule.y) if (r - tr) ** 2 + (g - tg) ** 2 + (b - tb) ** 2 < PIXEL_TOLERANCE ** 2 else None
+
+    window = SearchWindow(rule.window.region)
+    search, (ox, oy) = window.crop(frame.gray, frame, rule.w, rule.h)
+    found = reference.match_many(search, rule.variants)
+    if not found: return None
+    i, hit = found
+    return ox + hit.x + rule.variants[i].w // 2, oy + hit.y + rule.variants[i].h // 2
+
+
+def same_spot(a, b):
+    if a is None or b is None: return a is b
+    return abs(a[0] - b[0]) <= SPOT_TOLERANCE and abs(a[1] - b[1]) <= SPOT_TOLERANCE
+
+
+def replay(engine, source):
+    """
+    Runs the engine over every frame of `source`, one frame per frame budget of
+    virtual time. Returns (per-rule stats, seconds spent in the engine).
+    """
+    stats = {rule.name: RuleStats() for rule in engine.rules}
+    spots = {}
+
+    def on_detect(rule, seconds, spot):
+        stats[rule.name].times.append(seconds)
+        spots[rule.name] = spot
+
+    engine.on_detect = on_detect
+    reference = ExhaustiveMatcher()
+
+    total = 0.0
+    ticks = 0
+    while source.advance():
+        spots.clear()
+        start = time.perf_counter()
+        engine.step(source, now=ticks * engine.frame_budget)
+        total += time.perf_counter() - start
+        ticks += 1
+
+        frame = source.capture()
+        for rule in engine.rules:
+            # Rules in cooldown or still running actions were not checked on this frame
+            if rule.name not in spots: continue
+            spot = spots[rule.name]
+            expected = source.truth[rule.name] if source.truth is not None else expected_spot(rule, frame, reference)
+            s = stats[rule.name]
+            s.evaluated += 1
+            s.hits += spot is not None
+            s.correct += same_spot(spot, expected)
+    engine.close()
+    return stats, total
+
+
+def print_report(stats, total, frames, inputs):
+    print(f"{'Rule':<32}{'mean ms':>10}{'p95 ms':>10}{'checks':>8}{'hits':>8}{'accuracy':>10}")
+    for name, s in stats.items():
+        ms = np.array(s.times) * 1000 if s.times else np.zeros(1)
+        print(f"{name:<32}{ms.mean():>10.2f}{np.percentile(ms, 95):>10.2f}{s.evaluated:>8}{s.hits:>8}{100 * s.correct / max(s.evaluated, 1):>9.1f}%")
+    print(f"\n{frames} frames in {total:.2f}s -> {frames / total if total else 0:.1f} FPS, {len(inputs.events)} input events recorded")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay detector profiles headlessly and benchmark the engine.")
+    parser.add_argument("profiles", nargs="+", help="Saved detector .json profiles, in chain order")
+    parser.add_argument("--frames", help="Folder of recorded PNG frames")
+    parser.add_argument("--synthetic", type=int, metavar="N", help="Generate N synthetic frames instead")
+    parser.add_argument("--matcher", default="Balanced", choices=list(MATCHERS))
+    parser.add_argument("--parallel", action="store_true", help="Match image rules on a worker pool")
+    parser.add_argument("--fps", type=float, default=DEFAULT_FPS, help="Frame budget; each replayed frame advances the clock by 1/fps")
+    parser.add_argument("--skip-unchanged", action="store_true", help="Reuse results for screen areas that did not change")
+    args = parser.parse_args()
+    if not args.frames and not args.synthetic:
+        parser.error("give --frames or --synthetic")
+
+    active_rules = []
+    for path in args.profiles:
+        with open(path, "r") as f:
+            active_rules.append({"name": path, "data": json.load(f), "actions": [{"type": "Click Found Spot", "value": ""}]})
+
+    matcher = MATCHERS[args.matcher]
+    try:
+        rules, probes = compile_rules(active_rules, TemplateStore())
+    except RuleError as e:
+        parser.error(str(e))
+
+    if args.frames:
+        source = ImageFolderSource(args.frames, args.skip_unchanged)
+    else:
+        source = SyntheticSource(rules, args.synthetic, track_changes=args.skip_unchanged)
+
+    inputs = RecordingBackend()
+    engine = AutomationEngine(rules, probes, matcher, inputs, parallel=args.parallel, fps=args.fps)
+    engine.verbose = False
+    stats, total = replay(engine, source)
+    print_report(stats, total, len(source), inputs)
+
+
+if __name__ == "__main__":
+    main()
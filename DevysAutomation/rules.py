@@ -0,0 +1,180 @@
+import os
+import numpy as np
+from search_window import SearchWindow
+
+PIXEL_TOLERANCE = 20      # Max RGB distance for a pixel rule to count as matched
+DEFAULT_INTERVAL_MS = 100  # How often a rule is checked
+DEFAULT_COOLDOWN_MS = 500  # Pause after a rule's actions before it is checked again
+
+# Action opcodes
+PRESS_KEY, TYPE_TEXT, WAIT, CLICK_FOUND, CLICK_AT = range(5)
+
+ACTION_OPS = {
+    "Press Key": PRESS_KEY,
+    "Type Text": TYPE_TEXT,
+    "Wait (ms)": WAIT,
+    "Click Found Spot": CLICK_FOUND,
+    "Click Custom (X,Y)": CLICK_AT,
+}
+
+
+class RuleError(ValueError):
+    """Raised when a rule or one of its actions cannot be compiled."""
+
+
+class Action:
+    __slots__ = ("op", "arg")
+
+    def __init__(self, op, arg=None):
+        self.op = op
+        self.arg = arg  # key/text for PRESS_KEY/TYPE_TEXT, seconds for WAIT, (x, y) for CLICK_AT
+
+
+class Rule:
+    """Scheduling state shared by pixel and image rules (times are in seconds)."""
+
+    __slots__ = ("name", "actions", "interval", "cooldown", "priority", "due", "busy")
+
+    def __init__(self, name, actions, timing):
+        self.name = name
+        self.actions = actions
+        self.interval, self.cooldown, self.priority = timing
+        self.due = 0.0     # Clock time of the next check
+        self.busy = False  # Its action sequence is still running
+
+
+class PixelRule(Rule):
+    __slots__ = ("x", "y", "rgb", "probe")
+
+    def __init__(self, name, actions, timing, x, y, rgb):
+        super().__init__(name, actions, timing)
+        self.x = x
+        self.y = y
+        self.rgb = rgb
+        self.probe = None  # Index into PixelProbes' mask
+
+
+class PixelProbes:
+    """Every pixel rule of a chain, checked with one gather and one distance computation per frame."""
+
+    def __init__(self, rules):
+        self.rules = rules
+        self.xs = np.array([r.x for r in rules], dtype=np.intp)
+        self.ys = np.array([r.y for r in rules], dtype=np.intp)
+        self.targets = np.array([r.rgb for r in rules], dtype=np.int32).reshape(-1, 3)
+        for i, rule in enumerate(rules):
+            rule.probe = i
+
+    def check(self, frame):
+        """Boolean mask, in probe order, of the pixels matching their target colour."""
+        xs, ys = self.xs - frame.left, self.ys - frame.top
+        inside = (xs >= 0) & (xs < frame.width) & (ys >= 0) & (ys < frame.height)
+        # Out-of-frame probes read pixel 0,0 here; they are masked out and checked on their own
+        bgr = frame.bgra[np.where(inside, ys, 0), np.where(inside, xs, 0), :3].astype(np.int32)
+        dist = ((bgr[:, ::-1] - self.targets) ** 2).sum(axis=1)
+        return inside & (dist < PIXEL_TOLERANCE ** 2)
+
+
+class ImageRule(Rule):
+    """One or more templates (visual states and/or scales); the best-scoring variant wins."""
+
+    __slots__ = ("cache", "variants", "labels", "w", "h", "window", "best")
+
+    def __init__(self, name, actions, timing, variants, labels, window):
+        super().__init__(name, actions, timing)
+        self.cache = None
+        self.variants = variants
+        self.labels = labels
+        # The search window must fit the largest variant
+        self.w = max(v.w for v in variants)
+        self.h = max(v.h for v in variants)
+        self.window = window
+        self.best = None  # (label, score) of the variant behind the last hit
+
+
+def compile_action(action):
+    atype, aval = action["type"], action["value"]
+    if atype not in ACTION_OPS:
+        raise RuleError(f"Unknown action '{atype}'")
+    op = ACTION_OPS[atype]
+
+    if op == PRESS_KEY:
+        if not str(aval).strip(): raise RuleError("Press Key needs a key")
+        return Action(op, str(aval).strip())
+    if op == TYPE_TEXT:
+        return Action(op, str(aval))
+    if op == WAIT:
+        try: ms = float(aval)
+        except ValueError: raise RuleError(f"Invalid wait '{aval}'")
+        if ms < 0: raise RuleError(f"Invalid wait '{aval}'")
+        return Action(op, ms / 1000)
+    if op == CLICK_AT:
+        try:
+            cx, cy = (int(c.strip()) for c in str(aval).split(','))
+        except ValueError:
+            raise RuleError(f"Invalid coords '{aval}'")
+        return Action(op, (cx, cy))
+    return Action(op)
+
+
+def compile_timing(rule):
+    try:
+        interval = float(rule.get("interval_ms", DEFAULT_INTERVAL_MS))
+        cooldown = float(rule.get("cooldown_ms", DEFAULT_COOLDOWN_MS))
+        priority = int(rule.get("priority", 0))
+    except (TypeError, ValueError):
+        raise RuleError("Interval, cooldown and priority must be numbers")
+    if interval < 0 or cooldown < 0:
+        raise RuleError("Interval and cooldown can't be negative")
+    return interval / 1000, cooldown / 1000, priority
+
+
+def compile_rule(rule, templates):
+    name, data = rule["name"], rule["data"]
+    try:
+        actions = [compile_action(a) for a in rule["actions"]]
+        timing = compile_timing(rule)
+
+        if data.get("type") == "pixel":
+            try:
+                x, y = int(data["x"]), int(data["y"])
+                rgb = tuple(int(c) for c in str(data["rgb"]).split(','))
+            except (KeyError, ValueError):
+                raise RuleError("Invalid pixel X/Y/RGB")
+            if len(rgb) != 3 or not all(0 <= c <= 255 for c in rgb):
+                raise RuleError(f"Invalid RGB '{data['rgb']}'")
+            return PixelRule(name, actions, timing, x, y, rgb)
+
+        if data.get("type") == "image":
+            paths = data.get("image_paths") or [data.get("image_path", "")]
+            try:
+                scales = [float(s) for s in data.get("scales", [1.0])]
+            except (TypeError, ValueError):
+                raise RuleError(f"Invalid scales '{data.get('scales')}'")
+            if not scales or any(s <= 0 for s in scales):
+                raise RuleError(f"Invalid scales '{data.get('scales')}'")
+
+            variants, labels = [], []
+            for path in paths:
+                for scale in scales:
+                    template = templates.get(path, scale)
+                    if template is None:
+                        raise RuleError(f"Failed to load image: {path}")
+                    variants.append(template)
+                    labels.append(os.path.basename(path) if scale == 1.0 else f"{os.path.basename(path)} x{scale:g}")
+            try:
+                window = SearchWindow.from_profile(data)
+            except (TypeError, ValueError):
+                raise RuleError(f"Invalid search region '{data.get('region')}'")
+            return ImageRule(name, actions, timing, variants, labels, window)
+
+        raise RuleError(f"Unknown rule type '{data.get('type')}'")
+    except RuleError as e:
+        raise RuleError(f"{name}: {e}") from None
+
+
+def compile_rules(active_rules, templates):
+    """Turns the editor's rule dicts into typed rules, rejecting invalid profiles up front."""
+    rules = [compile_rule(rule, templates) for rule in active_rules]
+    probes = PixelProbes([r for r in rules if isinstance(r, PixelRule)])
+    return rules, probes
@@ -0,0 +1,68 @@
+ROI_PADDING = 150           # Pixels added around a captured template for "Around Capture"
+ADAPTIVE_PADDING = 24       # Margin kept around the last hit in adaptive mode
+
+
+def padded_region(x1, y1, x2, y2, pad=ROI_PADDING):
+    return [max(0, x1 - pad), max(0, y1 - pad), x2 + pad, y2 + pad]
+
+
+class SearchWindow:
+    """
+    The part of the screen an image rule is matched against.
+
+    `region` is [left, top, right, bottom] in screen coordinates (None means the
+    whole frame). In adaptive mode the window shrinks to the last hit and goes
+    back to the full region after a miss.
+    """
+
+    def __init__(self, region=None, adaptive=False):
+        self.region = region
+        self.adaptive = adaptive
+        self._focus = None
+
+    @classmethod
+    def from_profile(cls, data):
+        region = data.get("region")
+        if region and len(region) != 4:
+            raise ValueError("region must be [left, top, right, bottom]")
+        return cls(list(map(int, region)) if region else None, data.get("search") == "adaptive")
+
+    def rect(self, frame, tw, th):
+        """Window in frame coordinates, clipped to the frame and never smaller than the template."""
+        box = self._focus or self.region
+        if box is None:
+            return 0, 0, frame.width, frame.height
+
+        x1 = max(0, box[0] - frame.left); y1 = max(0, box[1] - frame.top)
+        x2 = min(frame.width, box[2] - frame.left); y2 = min(frame.height, box[3] - frame.top)
+
+        # Grow an undersized window around its centre so the template still fits
+        if x2 - x1 < tw:
+            x1 = max(0, min(frame.width - tw, (x1 + x2 - tw) // 2)); x2 = x1 + tw
+        if y2 - y1 < th:
+            y1 = max(0, min(frame.height - th, (y1 + y2 - th) // 2)); y2 = y1 + th
+        return x1, y1, x2, y2
+
+    @property
+    def narrowed(self):
+        return self._focus is not None
+
+    def crop(self, image, frame, tw, th):
+        """Returns the windowed view of `image` plus its (x, y) offset in the frame."""
+        x1, y1, x2, y2 = self.rect(frame, tw, th)
+        return image[y1:y2, x1:x2], (x1, y1)
+
+    def hit(self, x, y, w, h):
+        """Records a match whose top-left corner is at screen (x, y)."""
+        if not self.adaptive: return
+        pad = ADAPTIVE_PADDING
+        self._focus = self._clamp([x - pad, y - pad, x + w + pad, y + h + pad])
+
+    def miss(self):
+        self._focus = None  # Back to the full region
+
+    def _clamp(self, box):
+        if self.region is None:
+            return box
+        l, t, r, b = self.region
+        return [max(l, box[0]), max(t, box[1]), min(r, box[2]), min(b, box[3])]
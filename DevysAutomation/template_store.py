@@ -0,0 +1,105 @@
+import hashlib
+import json
+import os
+from collections import OrderedDict
+import cv2
+import numpy as np
+from matcher import PreparedTemplate, MAX_PYRAMID_LEVELS
+
+CACHE_DIR = os.path.join("images", ".cache")
+MEMORY_BUDGET = 256 * 1024 * 1024  # Bytes of decoded templates kept in memory
+
+
+class TemplateStore:
+    """
+    Decoded grayscale templates and their pyramid levels, shared by every rule using the same file.
+
+    Entries are keyed by absolute path and mtime, so editing a capture invalidates
+    it. The least recently used entries are evicted once the memory budget is
+    exceeded. Decoded pyramids are also written to `cache_dir` with a small
+    index.json, so a restart loads raw arrays instead of decoding and
+    downscaling every PNG again.
+    """
+
+    def __init__(self, cache_dir=CACHE_DIR, budget=MEMORY_BUDGET):
+        self.cache_dir = cache_dir
+        self.budget = budget
+        self.entries = OrderedDict()
+        self.nbytes = 0
+        self.index = self.load_index()
+
+    @property
+    def index_path(self):
+        return os.path.join(self.cache_dir, "index.json")
+
+    def load_index(self):
+        try:
+            with open(self.index_path, "r") as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {}
+
+    def save_index(self):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        tmp = self.index_path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(self.index, f)
+        os.replace(tmp, self.index_path)
+
+    def get(self, path, scale=1.0):
+        """Returns the PreparedTemplate for an image file at `scale`, or None if it can't be read."""
+        path = os.path.abspath(path)
+        try:
+            mtime = os.stat(path).st_mtime_ns
+        except OSError:
+            return None
+
+        key = (path, mtime, scale)
+        prepared = self.entries.get(key)
+        if prepared is not None:
+            self.entries.move_to_end(key)
+            return prepared
+
+        name = path if scale == 1.0 else f"{path}@{scale}"
+        prepared = self.load_cached(name, mtime)
+        if prepared is None:
+            img = cv2.imread(path, 0)
+            if img is None: return None
+            if scale != 1.0:
+                size = (max(1, round(img.shape[1] * scale)), max(1, round(img.shape[0] * scale)))
+                img = cv2.resize(img, size, interpolation=cv2.INTER_AREA if scale < 1 else cv2.INTER_LINEAR)
+            prepared = PreparedTemplate(img, MAX_PYRAMID_LEVELS)
+            self.write_cached(name, mtime, prepared)
+
+        self.entries[key] = prepared
+        self.nbytes += prepared.nbytes
+        self.evict()
+        return prepared
+
+    def evict(self):
+        # The newest entry always stays, even if it alone is over budget
+        while self.nbytes > self.budget and len(self.entries) > 1:
+            _, old = self.entries.popitem(last=False)
+            self.nbytes -= old.nbytes
+
+    def load_cached(self, name, mtime):
+        meta = self.index.get(name)
+        if not meta or meta["mtime"] != mtime or meta["levels"] != MAX_PYRAMID_LEVELS:
+            return None
+        try:
+            with np.load(os.path.join(self.cache_dir, meta["file"])) as data:
+                pyramid = [data[f"level{i}"] for i in range(len(data.files))]
+        except (OSError, ValueError, KeyError):
+            return None
+        return PreparedTemplate(pyramid[0], pyramid=pyramid)
+
+    def write_cached(self, name, mtime, prepared):
+        """`name` is the image path, suffixed with @scale for resized variants."""
+        file = hashlib.sha1(name.encode()).hexdigest()[:16] + ".npz"
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            np.savez(os.path.join(self.cache_dir, file), **{f"level{i}": level for i, level in enumerate(prepared.pyramid)})
+            self.index[name] = {"mtime": mtime, "levels": MAX_PYRAMID_LEVELS, "file": file}
+            self.save_index()
+        except OSError as e:
+            print(f"Could not cache template {name}: {e}")
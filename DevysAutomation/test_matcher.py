@@ -0,0 +1,18 @@
+import cv2
+import numpy as np
+import pytest
+from matcher import MATCHERS
+
+
+@pytest.mark.parametrize("trial", range(20))
+def test_presets_agree_with_exhaustive(trial):
+    # Every preset must find the same spot as the exhaustive pass on a synthetic frame
+    rng = np.random.default_rng(trial)
+    screen = cv2.GaussianBlur(rng.integers(0, 256, (720, 1280), dtype=np.uint8), (5, 5), 0)
+    th, tw = rng.integers(24, 96, 2)
+    ty, tx = rng.integers(0, 720 - th), rng.integers(0, 1280 - tw)
+    template = screen[ty:ty + th, tx:tx + tw].copy()
+    expected = MATCHERS["Exhaustive"].match(screen, MATCHERS["Exhaustive"].prepare(template))
+    for name, matcher in MATCHERS.items():
+        hit = matcher.match(screen, matcher.prepare(template))
+        assert hit and (hit.x, hit.y) == (expected.x, expected.y), f"{name}: {hit} != {expected}"
@@ -0,0 +1,84 @@
+"""
+Micro-benchmark for the on_message handler.
+
+Replays synthetic message events through main.on_message (no Discord connection,
+nothing is sent: queued deletes and reactions just pile up in the outbound queue)
+and reports handler throughput for quiet servers, servers with active features,
+and overall.
+
+Usage:
+    python bench_on_message.py --messages 200000 --guilds 500 --active 5
+"""
+import argparse
+import asyncio
+import os
+import random
+import tempfile
+import time
+from types import SimpleNamespace
+
+os.environ.setdefault("DEVYBOT_DB", os.path.join(tempfile.mkdtemp(), "bench.db"))
+import main
+from storage import MUTED, REDDIT, SMASH_OR_PASS
+
+
+async def noop():
+    pass
+
+
+def make_messages(count, guilds, active, seed=0):
+    rng = random.Random(seed)
+    messages = []
+    for i in range(count):
+        guild_id = rng.randrange(1, guilds + 1)
+        channel_id = guild_id * 100 + rng.randrange(5)
+        prefix = rng.random() < 0.01
+        messages.append(SimpleNamespace(
+            id=i, guild=SimpleNamespace(id=guild_id), channel=SimpleNamespace(id=channel_id),
+            # Prefix messages come from a bot account so process_commands returns without a network call
+            author=SimpleNamespace(id=rng.randrange(1, 1000), bot=prefix),
+            content="!roll 20" if prefix else "hello there", attachments=[1] if rng.random() < 0.2 else [],
+            delete=noop, add_reaction=lambda emoji: noop(),
+        ))
+    return messages
+
+
+async def run(args):
+    # The first `active` servers get a muted user, a reddit channel and a smash-or-pass channel
+    for guild_id in range(1, args.active + 1):
+        state = main.store.guild(guild_id)
+        state.add(MUTED, 1)
+        state.toggle_channel(REDDIT, guild_id * 100)
+        state.toggle_channel(SMASH_OR_PASS, guild_id * 100 + 1)
+
+    messages = make_messages(args.messages, args.guilds, args.active)
+    for message in messages[:args.guilds * 5]:  # Warm the interest index
+        await main.on_message(message)
+
+    times = {"quiet": [0, 0.0], "active": [0, 0.0]}
+    for message in messages:
+        kind = "active" if message.guild.id <= args.active else "quiet"
+        start = time.perf_counter()
+        await main.on_message(message)
+        times[kind][0] += 1
+        times[kind][1] += time.perf_counter() - start
+
+    print(f"{'Servers':<10}{'messages':>10}{'us/msg':>10}{'msgs/s':>12}")
+    for kind, (n, total) in times.items():
+        if n: print(f"{kind:<10}{n:>10}{total / n * 1e6:>10.2f}{n / total:>12.0f}")
+    n = sum(t[0] for t in times.values()); total = sum(t[1] for t in times.values())
+    print(f"{'all':<10}{n:>10}{total / n * 1e6:>10.2f}{n / total:>12.0f}")
+    print(f"Outbound backlog left queued: {main.outbound.backlog()}")
+    await main.store.flush()
+
+
+def cli():
+    parser = argparse.ArgumentParser(description="Benchmark the on_message handler with synthetic events.")
+    parser.add_argument("--messages", type=int, default=200000)
+    parser.add_argument("--guilds", type=int, default=500, help="Servers the messages are spread over")
+    parser.add_argument("--active", type=int, default=5, help="How many of them have muted users or channel features on")
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    cli()
@@ -0,0 +1,344 @@
+"""
+Dice expressions for /roll.
+
+    2d6+1d4+3     several terms, added or subtracted
+    4d6kh3        keep the highest 3 (kl = keep lowest, k = kh)
+    3d6!          exploding dice: a max roll adds another die
+    6x4d6kh3      repeat the whole expression 6 times
+    d20, d%       one die; d% is d100
+
+Expressions are parsed once and cached by their text. Pools up to
+DETAIL_LIMIT dice are rolled one by one so every die can be shown; bigger
+pools are rolled as NumPy arrays and only their summary is kept.
+
+`distribution()` gives the exact probability of every total by convolving
+per-die distributions (no simulation); test_dice.py checks it against
+brute-force enumeration.
+"""
+import math
+import random
+import re
+from functools import lru_cache
+import numpy as np
+
+MAX_DICE = 1_000_000  # Dice per expression (before explosions)
+MAX_SIDES = 10_000
+MAX_TERMS = 20
+MAX_REPEAT = 20
+MAX_EXPLOSIONS = 100  # Explosion rounds per pool
+DETAIL_LIMIT = 100    # Pools larger than this are vectorised and not listed die by die
+SHOWN_ROLLS = 20      # Rolls listed per term in a truncated breakdown
+STATS_MAX_OUTCOMES = 200_000  # Distinct totals /rollstats will compute
+STATS_MAX_KEEP_DICE = 60      # Keep-highest/lowest pools are an O(faces x dice^2 x kept sum) walk...
+STATS_MAX_KEEP_WORK = 2e8     # ...so they are also refused above this many array-element updates (about a second)
+KEEP_STEP_OVERHEAD = 64       # Python overhead of one walk step, in array elements
+FFT_THRESHOLD = 1_000_000     # Convolutions bigger than len(a) * len(b) go through the FFT
+EXPLODE_EPSILON = 1e-15       # Exploding dice are followed until a chain is less likely than this
+
+TERM = re.compile(r"([+-])(?:(\d*)d(\d+|%)(!?)(?:(kh|kl|k)(\d+))?|(\d+))")
+REPEAT = re.compile(r"(\d+)x(.+)")
+
+
+class DiceError(ValueError):
+    pass
+
+
+class DiceTerm:
+    __slots__ = ("sign", "count", "sides", "explode", "keep", "keep_count")
+
+    def __init__(self, sign, count, sides, explode=False, keep=None, keep_count=0):
+        self.sign = sign
+        self.count = count
+        self.sides = sides
+        self.explode = explode
+        self.keep = keep          # None, "kh" or "kl"
+        self.keep_count = keep_count
+
+    def __str__(self):
+        keep = f"{self.keep}{self.keep_count}" if self.keep else ""
+        return f"{self.count}d{self.sides}{'!' if self.explode else ''}{keep}"
+
+
+class Expression:
+    """A parsed expression: dice terms, a flat modifier and a repeat count."""
+
+    def __init__(self, text, terms, modifier, repeat):
+        self.text = text
+        self.terms = terms
+        self.modifier = modifier
+        self.repeat = repeat
+
+    @property
+    def dice(self):
+        return sum(t.count for t in self.terms)
+
+
+class TermRoll:
+    __slots__ = ("term", "total", "shown", "truncated")
+
+    def __init__(self, term, total, shown, truncated):
+        self.term = term
+        self.total = total
+        self.shown = shown          # Kept rolls (all of them, or the first SHOWN_ROLLS for big pools)
+        self.truncated = truncated
+
+    def __str__(self):
+        rolls = ", ".join(map(str, self.shown)) + (", ..." if self.truncated else "")
+        return f"{'-' if self.term.sign < 0 else ''}{self.term}: [{rolls}]"
+
+
+class Roll:
+    def __init__(self, total, terms, modifier):
+        self.total = total
+        self.terms = terms
+        self.modifier = modifier
+
+    def breakdown(self):
+        parts = [str(t) for t in self.terms]
+        if self.modifier: parts.append(f"{self.modifier:+d}")
+        return " ".join(parts)
+
+
+def normalize(text):
+    return re.sub(r"\s+", "", text.lower())
+
+
+def compile_expression(text):
+    """Parses `text` (see module docstring). Raises DiceError with a short reason."""
+    return _compile(normalize(text))
+
+
+@lru_cache(maxsize=256)
+def _compile(text):
+    repeat = 1
+    m = REPEAT.fullmatch(text)
+    if m:
+        repeat, text = int(m.group(1)), m.group(2)
+        if not 1 <= repeat <= MAX_REPEAT: raise DiceError(f"Repeat between 1 and {MAX_REPEAT} times.")
+    if not text: raise DiceError("Empty expression.")
+
+    shift = 0 if text[0] in "+-" else 1
+    body = "+" * shift + text
+    terms, modifier, pos = [], 0, 0
+    while pos < len(body):
+        m = TERM.match(body, pos)
+        if not m: raise DiceError(f"Can't read '{text[max(pos - shift, 0):]}'.")
+        sign, count, sides, explode, keep, keep_count, number = m.groups()
+        sign = -1 if sign == "-" else 1
+        if number is not None:
+            modifier += sign * int(number)
+        else:
+            count = int(count) if count else 1
+            sides = 100 if sides == "%" else int(sides)
+            if count < 1 or not 1 <= sides <= MAX_SIDES: raise DiceError(f"Dice need 1 to {MAX_SIDES} sides.")
+            if explode and sides == 1: raise DiceError("A d1 can't explode.")
+            if keep == "k": keep = "kh"
+            keep_count = int(keep_count) if keep else 0
+            if keep and not 1 <= keep_count <= count: raise DiceError(f"Can't keep {keep_count} of {count} dice.")
+            terms.append(DiceTerm(sign, count, sides, bool(explode), keep, keep_count))
+        pos = m.end()
+
+    if not terms: raise DiceError("Need at least one die, e.g. 1d20.")
+    if len(terms) > MAX_TERMS: raise DiceError(f"At most {MAX_TERMS} dice terms.")
+    expression = Expression(text, tuple(terms), modifier, repeat)
+    if expression.dice * repeat > MAX_DICE: raise DiceError(f"At most {MAX_DICE:,} dice.")
+    return expression
+
+
+def roll_small(term, rng=random):
+    """Rolls die by die and returns every kept roll."""
+    rolls = []
+    for _ in range(term.count):
+        value = roll = rng.randint(1, term.sides)
+        explosions = 0
+        while term.explode and roll == term.sides and explosions < MAX_EXPLOSIONS:
+            roll = rng.randint(1, term.sides)
+            value += roll
+            explosions += 1
+        rolls.append(value)
+    if term.keep:
+        rolls = sorted(rolls, reverse=term.keep == "kh")[:term.keep_count]
+    return TermRoll(term, term.sign * sum(rolls), rolls, False)
+
+
+def roll_large(term, rng=None):
+    """Rolls the whole pool as one array; only the total and the first few kept rolls are kept."""
+    rng = rng or np.random.default_rng()
+    rolls = rng.integers(1, term.sides + 1, term.count)
+    if term.explode:
+        live = np.flatnonzero(rolls == term.sides)
+        for _ in range(MAX_EXPLOSIONS):
+            if not len(live): break
+            extra = rng.integers(1, term.sides + 1, len(live))
+            rolls[live] += extra
+            live = live[extra == term.sides]
+    if term.keep:
+        k = term.keep_count
+        # partition is O(n); only the kept slice is summed
+        rolls = np.partition(rolls, len(rolls) - k)[-k:] if term.keep == "kh" else np.partition(rolls, k - 1)[:k]
+    total = int(rolls.sum(dtype=np.int64))
+    return TermRoll(term, term.sign * total, rolls[:SHOWN_ROLLS].tolist(), len(rolls) > SHOWN_ROLLS)
+
+
+def roll_once(expression):
+    terms = [roll_small(t) if t.count <= DETAIL_LIMIT else roll_large(t) for t in expression.terms]
+    return Roll(sum(t.total for t in terms) + expression.modifier, terms, expression.modifier)
+
+
+def roll(text):
+    """Rolls an expression string; returns one Roll per repeat."""
+    expression = compile_expression(text)
+    return [roll_once(expression) for _ in range(expression.repeat)]
+
+
+# =======================================================
+# EXACT DISTRIBUTIONS
+# =======================================================
+class Distribution:
+    """P(total = offset + i) = probs[i]."""
+
+    def __init__(self, offset, probs):
+        self.offset = offset
+        self.probs = probs
+        self.probs.flags.writeable = False  # Shared through the cache
+
+    @property
+    def values(self):
+        return np.arange(self.offset, self.offset + len(self.probs))
+
+    @property
+    def mean(self):
+        return float(self.values @ self.probs)
+
+    @property
+    def variance(self):
+        return float(((self.values - self.mean) ** 2) @ self.probs)
+
+    def percentile(self, p):
+        """Smallest total whose cumulative probability reaches p (0-100)."""
+        index = np.searchsorted(np.cumsum(self.probs), p / 100 - 1e-12)
+        return self.offset + int(min(index, len(self.probs) - 1))
+
+    def prob(self, total):
+        i = total - self.offset
+        return float(self.probs[i]) if 0 <= i < len(self.probs) else 0.0
+
+
+def convolve(a, b):
+    if len(a.probs) * len(b.probs) <= FFT_THRESHOLD:
+        return Distribution(a.offset + b.offset, np.convolve(a.probs, b.probs))
+    # O(n log n) instead of O(n * m); rounding leaves ~1e-17 noise, so clip the negatives
+    n = len(a.probs) + len(b.probs) - 1
+    size = 1 << (n - 1).bit_length()
+    probs = np.fft.irfft(np.fft.rfft(a.probs, size) * np.fft.rfft(b.probs, size), size)[:n]
+    return Distribution(a.offset + b.offset, np.clip(probs, 0, None))
+
+
+def explode_depth(sides):
+    """Rerolls followed for an exploding die before a chain is rarer than EXPLODE_EPSILON."""
+    return max(1, math.ceil(math.log(EXPLODE_EPSILON) / math.log(1 / sides)))
+
+
+def die_distribution(sides, explode=False):
+    """One die. An exploding die's totals are cut off once a chain is rarer than EXPLODE_EPSILON."""
+    if not explode:
+        return Distribution(1, np.full(sides, 1 / sides))
+    depth = explode_depth(sides)
+    probs = np.zeros(sides * depth)
+    for chain in range(depth):
+        # `chain` maxed rolls, then a non-max roll r: total chain * sides + r
+        probs[chain * sides:chain * sides + sides - 1] = (1 / sides) ** (chain + 1)
+    return Distribution(1, probs)
+
+
+def sum_of(die, count):
+    """`count` independent copies of `die`, by repeated squaring (O(log count) convolutions)."""
+    result, power = None, die
+    while count:
+        if count & 1: result = power if result is None else convolve(result, power)
+        count >>= 1
+        if count: power = convolve(power, power)
+    return result
+
+
+def keep_distribution(die, count, keep, keep_count):
+    """
+    Sum of the highest (or lowest) `keep_count` of `count` dice.
+
+    Walks the faces from the kept end, choosing how many dice land on each face.
+    state[j] is the distribution of the kept sum with j dice placed so far, weighted
+    by p^c / c! per face so the multinomial count comes out at the end.
+    """
+    faces = [(die.offset + i, p) for i, p in enumerate(die.probs) if p > 0]
+    if keep == "kh": faces.reverse()
+    max_sum = max(abs(v) for v, _ in faces) * keep_count
+    state = [np.zeros(max_sum + 1) for _ in range(count + 1)]
+    state[0][0] = 1.0
+    for value, p in faces:
+        nxt = [s.copy() for s in state]  # c = 0 dice on this face
+        for j in range(count):
+            if not state[j].any(): continue
+            weight = 1.0
+            for c in range(1, count - j + 1):
+                weight *= p / c
+                shift = value * max(0, min(c, keep_count - j))
+                if shift: nxt[j + c][shift:] += state[j][:len(state[j]) - shift] * weight
+                else: nxt[j + c] += state[j] * weight
+        state = nxt
+    probs = state[count] * math.factorial(count)
+    return Distribution(0, probs)
+
+
+def keep_work(term):
+    """Estimated array-element updates of keep_distribution for this term."""
+    faces = term.sides * (explode_depth(term.sides) if term.explode else 1)
+    return faces * term.count * (term.count + 1) // 2 * (faces * term.keep_count + KEEP_STEP_OVERHEAD)
+
+
+def term_distribution(term):
+    die = die_distribution(term.sides, term.explode)
+    if term.keep:
+        dist = keep_distribution(die, term.count, term.keep, term.keep_count)
+    else:
+        dist = sum_of(die, term.count)
+    if term.sign < 0:
+        dist = Distribution(-(dist.offset + len(dist.probs) - 1), dist.probs[::-1].copy())
+    return dist
+
+
+def trim(dist):
+    """Drops the zero-probability ends (keep pools start at 0, not at their minimum)."""
+    nonzero = np.flatnonzero(dist.probs > 0)
+    return Distribution(dist.offset + int(nonzero[0]), dist.probs[nonzero[0]:nonzero[-1] + 1].copy())
+
+
+def distribution(text, rule="normal"):
+    """
+    Exact distribution of one roll of `text` ("adv"/"dis" = best/worst of two rolls).
+    Memoised by normalised expression, so repeated queries cost nothing.
+    """
+    return _distribution(normalize(text), rule)
+
+
+@lru_cache(maxsize=128)
+def _distribution(text, rule):
+    expression = _compile(text)
+    size = 1 + sum(t.count * t.sides * (explode_depth(t.sides) if t.explode else 1) for t in expression.terms)
+    if size > STATS_MAX_OUTCOMES: raise DiceError(f"Too many possible totals to list (limit {STATS_MAX_OUTCOMES:,}).")
+    # Checked up front so a slow keep pool is refused before any work is done
+    for t in expression.terms:
+        if not t.keep: continue
+        if t.count > STATS_MAX_KEEP_DICE: raise DiceError(f"Stats for keep pools need at most {STATS_MAX_KEEP_DICE} dice.")
+        if keep_work(t) > STATS_MAX_KEEP_WORK: raise DiceError(f"{t} is too big to compute exactly; use fewer dice, sides or kept dice.")
+
+    dist = Distribution(expression.modifier, np.ones(1))
+    for term in expression.terms:
+        dist = trim(convolve(dist, term_distribution(term)))
+    if rule in ("adv", "dis"):
+        cdf = np.cumsum(dist.probs)
+        if rule == "adv":
+            cdf2 = cdf ** 2                 # P(max <= x)
+        else:
+            cdf2 = 1 - (1 - cdf) ** 2       # P(min <= x)
+        dist = Distribution(dist.offset, np.diff(cdf2, prepend=0.0))
+    return dist
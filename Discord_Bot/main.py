@@ -1,99 +1,161 @@
 import asyncio
-import json
 import discord
 from discord import app_commands
 from discord.ext import commands, tasks
 import os
 from dotenv import load_dotenv
 import random
-from datetime import datetime
+import hashlib
+import json
+import sys
+from collections import namedtuple
+from datetime import datetime, timedelta
+try:
+    import psutil
+except ImportError:
+    psutil = None
+try:
+    import resource
+except ImportError:
+    resource = None  # Windows
+import dice
+from outbound import OutboundQueue, MODERATION, NICKNAME, COSMETIC
+from storage import BotStore, GLOBAL, VOICEBANNED, MUTED, ADMIN, NAME_ON, NAME_OFF, REDDIT, SMASH_OR_PASS, NAMES_ENFORCED, NAMES_GLOBAL
 
 # --- Constants and Setup ---
 
-DATA_FILE = "bot_data.json"
-NAMES_FILE = "names.json"
-
 # Load Token
 load_dotenv()
 DevyBot = os.getenv('DISCORD_TOKEN')
 
-intents = discord.Intents.all()
-bot = commands.Bot(command_prefix="!", intents=intents)
+DATA_FILE = "bot_data.json"  # Old JSON state, imported into the database once
+NAMES_FILE = "names.json"
+DB_FILE = os.getenv("DEVYBOT_DB", "bot_data.db")
+
+# Sharding: leave both unset for a single connection. DEVYBOT_SHARD_COUNT alone runs every shard in
+# this process; adding DEVYBOT_SHARD_IDS (e.g. "0,1") runs only those, so the rest can be other processes
+# sharing the same DEVYBOT_DB.
+SHARD_COUNT = int(os.getenv("DEVYBOT_SHARD_COUNT", "0")) or None
+SHARD_IDS = [int(x) for x in os.getenv("DEVYBOT_SHARD_IDS", "").split(",") if x.strip()] or None
+SHARDED = SHARD_COUNT is not None or SHARD_IDS is not None
+MAIN_PROCESS = SHARD_IDS is None or 0 in SHARD_IDS  # Runs the one-off jobs: JSON migration and command sync
+SHARED_REFRESH_SECONDS = 60  # How often split shard processes re-read global settings
+
+# Cache profile: "full" keeps every member, presence and message in memory. "lean" asks only for what
+# the features use and only loads the member lists of servers with sticky nicknames on.
+LEAN = os.getenv("DEVYBOT_PROFILE", "full").lower() == "lean"
+
+if LEAN:
+    intents = discord.Intents.none()
+    intents.guilds = True
+    intents.members = True          # Nickname events and joins
+    intents.voice_states = True     # Voiceban, hard mute, move spam
+    intents.guild_messages = True
+    intents.dm_messages = True
+    intents.message_content = True  # Prefix commands
+    cache_options = {
+        # Keep members we were sent (joins, chunks of name-enforced servers) and anyone in voice
+        "member_cache_flags": discord.MemberCacheFlags(voice=True, joined=True),
+        "chunk_guilds_at_startup": False,
+        "max_messages": None,  # Reaction cleanup and deletes use raw events, so no message cache is needed
+    }
+else:
+    intents = discord.Intents.all()
+    cache_options = {}
+
+class Bot(commands.AutoShardedBot if SHARDED else commands.Bot):
+    async def setup_hook(self):
+        await setup_state()
+
+    async def close(self):
+        # Write anything still waiting in the save debounce before disconnecting
+        await store.flush()
+        outbound.stop()
+        await super().close()
+        store.close()
+
+COMMAND_PREFIX = "!"
+shard_options = {"shard_count": SHARD_COUNT, "shard_ids": SHARD_IDS} if SHARDED else {}
+bot = Bot(command_prefix=COMMAND_PREFIX, intents=intents, **shard_options, **cache_options)
 
 TEST_GUILD_ID = None
 
 spam_move_tasks = {}
+reconciling = set()  # Guild ids with a nickname reconcile in progress
+reconcile_tasks = set()  # Background reconciles; the loop only keeps weak references to tasks
+outbound = OutboundQueue()  # Paced, deduplicated path for automatic edits, deletes and reactions
 
-# --- Global Data Variables ---
-voicebanned_members = set()
-reddit_mode_channels = set()
-smash_or_pass_channels = set()
-bot_admins = set()
-muted_members = set()
+NICK_SWEEP_MINUTES = 30   # How often the safety-net sweep re-checks every enforced member
 
-# Name Enforcement Variables
-disabled_name_enforcements = set() 
-enabled_name_enforcements = set()  
-enforced_names = {}                
-name_enforced_guilds = set()
-name_enforcement_on = False        
+# --- Bot State ---
+# Per-server sets and nicknames live in SQLite (see storage.py); store.guild(id) gives one server's state
+store = BotStore(DB_FILE)
+
+# on_message interest index: guild id (None for DMs) -> Interest, or None when nothing in that server
+# needs to see messages. Built on first use and dropped whenever that server's flags change.
+interests = {}
+Interest = namedtuple("Interest", ["muted", "channels"])  # muted user ids, channel id -> set of channel flags
 
 # --- Utility Functions ---
 
-def load_data():
-    """Loads bot_data.json"""
-    try:
-        with open(DATA_FILE, 'r') as f:
-            data = json.load(f)
-            return (
-                set(data.get("voicebanned_members", [])),
-                set(data.get("reddit_mode_channels", [])),
-                set(data.get("smash_or_pass_channels", [])),
-                set(data.get("admins", [])),
-                set(data.get("muted_members", [])),
-                set(data.get("disabled_name_enforcements", [])),
-                set(data.get("enabled_name_enforcements", [])),
-                set(data.get("name_enforced_guilds", [])) # <--- NEW
-            )
-    except (FileNotFoundError, json.JSONDecodeError):
-        print("Data file not found or corrupted. Creating new data sets.")
-        return set(), set(), set(), set(), set(), set(), set(), set()
-
-def save_data():
-    """Saves bot_data.json"""
-    with open(DATA_FILE, 'w') as f:
-        data = {
-            "voicebanned_members": list(voicebanned_members),
-            "reddit_mode_channels": list(reddit_mode_channels),
-            "smash_or_pass_channels": list(smash_or_pass_channels),
-            "admins": list(bot_admins),
-            "muted_members": list(muted_members),
-            "disabled_name_enforcements": list(disabled_name_enforcements),
-            "enabled_name_enforcements": list(enabled_name_enforcements),
-            "name_enforced_guilds": list(name_enforced_guilds) # <--- NEW
-        }
-        json.dump(data, f, indent=4)
-
-def load_names():
-    """Loads names.json"""
+def owns_guild(guild_id):
+    """True if this process runs the shard that guild belongs to."""
+    if SHARD_IDS is None: return True
+    return (guild_id >> 22) % SHARD_COUNT in SHARD_IDS
+
+def name_enforcement_on():
+    # Stored on the GLOBAL row so every shard process sees the same switch
+    return store.global_state.enabled(NAMES_GLOBAL)
+
+def build_interest(guild_id):
+    state = store.guild(guild_id)
+    muted = state.members.get(MUTED, set()) | store.global_state.members.get(MUTED, set())
+    channels = {}
+    for flag in (REDDIT, SMASH_OR_PASS):
+        for source in (state, store.global_state):
+            for channel_id in source.channels.get(flag, ()):
+                channels.setdefault(channel_id, set()).add(flag)
+    interest = Interest(frozenset(muted), channels) if muted or channels else None
+    interests[guild_id] = interest
+    return interest
+
+def forget_interest(guild_id):
+    if guild_id == GLOBAL: interests.clear()
+    else: interests.pop(guild_id, None)
+
+store.listeners.append(forget_interest)
+
+def resident_memory():
+    """Resident set size of this process in bytes (peak size where the current one isn't available)."""
+    if psutil: return psutil.Process().memory_info().rss
     try:
-        with open(NAMES_FILE, 'r') as f:
-            data = json.load(f)
-            return {int(k): v for k, v in data.items()}
-    except (FileNotFoundError, json.JSONDecodeError):
-        print("Names file not found. Starting empty.")
-        return {}
-
-def save_names():
-    """Saves names.json"""
-    with open(NAMES_FILE, 'w') as f:
-        json.dump(enforced_names, f, indent=4)
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        pass
+    if resource:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024
+    return 0
+
+def memory_report():
+    guilds = bot.guilds
+    rss = resident_memory()
+    members = sum(len(g.members) for g in guilds)
+    return {
+        "profile": "lean" if LEAN else "full",
+        "rss_mb": rss / 2**20,
+        "guilds": len(guilds),
+        "per_guild_kb": rss / 1024 / max(len(guilds), 1),
+        "members": members,
+        "messages": len(bot.cached_messages),
+    }
 
 def is_allowed(interaction: discord.Interaction) -> bool:
     dev_id = 445681610965123082 
     if interaction.user.id == dev_id: return True
     if interaction.guild and interaction.user.id == interaction.guild.owner_id: return True
-    if interaction.user.id in bot_admins: return True
+    if store.guild(interaction.guild_id).has(ADMIN, interaction.user.id): return True
     return False
 
 # --- ASYNC LOOPS ---
@@ -116,153 +178,228 @@ async def move_spam_loop(member: discord.Member, channel1: discord.VoiceChannel,
             print(f"Error during move_spam_loop: {e}")
             await asyncio.sleep(5)
 
-@tasks.loop(seconds=10)
+def forced_nick_for(member):
+    """The nickname `member` must have right now, or None if they are free to pick their own."""
+    state = store.guild(member.guild.id)
+    if not state.enabled(NAMES_ENFORCED): return None
+    forced_nick = state.nick(member.id)
+    if forced_nick is None or state.has(NAME_OFF, member.id): return None
+    if not (name_enforcement_on() or state.has(NAME_ON, member.id)): return None
+    return forced_nick
+
+async def apply_nickname(member):
+    # Re-checked when the queue gets to it, so only the latest wanted name is ever sent
+    forced_nick = forced_nick_for(member)
+    if forced_nick is not None and member.display_name != forced_nick:
+        await member.edit(nick=forced_nick)
+
+def enforce_nickname(member):
+    """Queues a fix for one member's nickname. Returns True if one was needed."""
+    forced_nick = forced_nick_for(member)
+    if forced_nick is None or member.display_name == forced_nick: return False
+    if member.id == member.guild.owner_id: return False
+    if member.top_role >= member.guild.me.top_role: return False
+    outbound.submit(("nick", member.guild.id, member.id), ("member", member.guild.id), NICKNAME, lambda: apply_nickname(member))
+    return True
+
+async def reconcile_nicknames(guild):
+    """
+    Checks only the enforced members of one server and fixes any that drifted while
+    we weren't listening (startup, reconnect, joining a server, turning a switch on).
+    The fixes go through the outbound queue, which paces them per server.
+    """
+    if guild.id in reconciling or not owns_guild(guild.id): return
+    state = store.guild(guild.id)
+    if not state.enabled(NAMES_ENFORCED): return
+    reconciling.add(guild.id)
+    try:
+        if LEAN and not guild.chunked:
+            await guild.chunk()  # Lean mode only loads member lists for servers that need them
+        for user_id in list(state.all_nicknames()):
+            member = guild.get_member(user_id)
+            if member: enforce_nickname(member)
+            await asyncio.sleep(0)  # Let other events run during a long list
+    finally:
+        reconciling.discard(guild.id)
+
+def start_reconcile(guild):
+    task = asyncio.create_task(reconcile_nicknames(guild))
+    reconcile_tasks.add(task)
+    task.add_done_callback(reconcile_tasks.discard)
+
+def reconcile_all():
+    for guild in bot.guilds:
+        start_reconcile(guild)
+
+@tasks.loop(minutes=NICK_SWEEP_MINUTES)
 async def enforce_nicknames_loop():
+    """Rare safety net; on_member_update does the real-time work."""
     for guild in bot.guilds:
-        if guild.id not in name_enforced_guilds:
-            continue
+        await reconcile_nicknames(guild)
 
-        for user_id, forced_nick in enforced_names.items():
-            
-            if user_id in disabled_name_enforcements:
-                continue
+@tasks.loop(seconds=SHARED_REFRESH_SECONDS)
+async def refresh_shared_state():
+    """With shards split over processes, picks up global switches and admins changed by the others."""
+    await store.flush()
+    store.reload_global()
 
-            should_enforce = name_enforcement_on or (user_id in enabled_name_enforcements)
+# --- Events ---
 
-            if not should_enforce:
-                continue
+def command_tree_hash():
+    """Hash of everything Discord stores about our slash commands: names, options, choices, contexts."""
+    payload = sorted((cmd.to_dict(bot.tree) for cmd in bot.tree.get_commands()), key=lambda c: c["name"])
+    return hashlib.sha256(json.dumps(payload, sort_keys=True).encode()).hexdigest()
+
+async def sync_commands():
+    """Syncs the command tree only when it differs from the last successful sync by this application."""
+    guild_obj = discord.Object(id=TEST_GUILD_ID) if TEST_GUILD_ID else None
+    if guild_obj: bot.tree.copy_global_to(guild=guild_obj)
+    key = f"command_hash:{bot.application_id}:{TEST_GUILD_ID or 'global'}"
+    digest = command_tree_hash()
+    if store.get_meta(key) == digest:
+        print("Commands unchanged, skipping sync.")
+        return
+    try:
+        await bot.tree.sync(guild=guild_obj)
+        store.set_meta(key, digest)
+        print(f"Synced commands {'to the test server' if guild_obj else 'globally'}.")
+    except Exception as e:
+        print(f"Error syncing commands: {e}")
 
-            member = guild.get_member(user_id)
-            
-            if member and member.display_name != forced_nick:
-                if member.id == guild.owner_id: continue
-                if member.top_role >= guild.me.top_role: continue
-                
-                try:
-                    await member.edit(nick=forced_nick)
-                except discord.Forbidden:
-                    pass
-                except Exception as e:
-                    print(f"Error changing nickname in loop: {e}")
+async def setup_state():
+    """Once per process, from setup_hook: state, workers and the command sync."""
+    # Import the old JSON files the first time the database is used
+    if MAIN_PROCESS and store.migrate_json(DATA_FILE, NAMES_FILE):
+        print(f"Migrated {DATA_FILE} and {NAMES_FILE} into {DB_FILE}.")
+    totals = store.totals()
+    outbound.start()
 
-# --- Events ---
+    os.system('cls' if os.name == 'nt' else 'clear')
+    print("=====================================================")
+    print(f"Logged in as: {bot.user}")
+    print(f"Loaded {totals['admins']} admins.")
+    print(f"Loaded {totals['names']} enforced names.")
+    print(f"Active in {totals['servers']} servers.")
+    print(f"Global Name Mode: {name_enforcement_on()}")
+    print("=====================================================")
+
+    # The process running shard 0 syncs the commands for everyone
+    if MAIN_PROCESS: await sync_commands()
 
 @bot.event
 async def on_ready():
-    global voicebanned_members, reddit_mode_channels, smash_or_pass_channels, bot_admins, muted_members, enforced_names, disabled_name_enforcements, enabled_name_enforcements, name_enforced_guilds
-    
-    # 1. Load basic data
-    voicebanned_members, reddit_mode_channels, smash_or_pass_channels, bot_admins, muted_members, disabled_name_enforcements, enabled_name_enforcements, name_enforced_guilds = load_data()
-    
-    # 2. Load names directly from the JSON file
-    enforced_names = load_names()
-    
-    # Start the loop
+    # Fires again after every reconnect, so only catch up on what we may have missed
+    reconcile_all()
     if not enforce_nicknames_loop.is_running():
         enforce_nicknames_loop.start()
+    if SHARD_IDS is not None and not refresh_shared_state.is_running():
+        refresh_shared_state.start()
 
-    os.system('cls' if os.name == 'nt' else 'clear')
-    print("=====================================================")
-    print(f"Logged in as: {bot.user}")
-    print(f"Loaded {len(bot_admins)} admins.")
-    print(f"Loaded {len(enforced_names)} enforced names.")
-    print(f"Active in {len(name_enforced_guilds)} servers.")
-    print(f"Global Name Mode: {name_enforcement_on}")
-    print("=====================================================")
-    
-    try:
-        if TEST_GUILD_ID:
-            guild_obj = discord.Object(id=TEST_GUILD_ID)
-            bot.tree.copy_global_to(guild=guild_obj)
-            await bot.tree.sync(guild=guild_obj)
-        else:
-            await bot.tree.sync()
-            print("Synced commands globally.")
-            
-    except Exception as e:
-        print(f"Error syncing commands: {e}")
-        
+    if SHARDED:
+        print(f"Shards: {sorted(bot.shards)} of {bot.shard_count} ({len(bot.guilds)} servers here).")
+    report = memory_report()
+    print(f"Ready. Memory ({report['profile']}): {report['rss_mb']:.0f} MB, {report['per_guild_kb']:.0f} KB per server, {report['members']} members cached.")
     await bot.change_presence(activity=discord.Game(name="Listening for /commands"))
 
 @bot.tree.error
 async def on_app_command_error(interaction: discord.Interaction, error: app_commands.AppCommandError):
-    if isinstance(error, app_commands.CheckFailure):
-        await interaction.response.send_message('You do not have permission to use this command.', ephemeral=True)
-    elif isinstance(error, app_commands.TransformerError):
-         await interaction.response.send_message('Invalid input provided.', ephemeral=True)
-    else:
-        await interaction.response.send_message('An unexpected error occurred.', ephemeral=True)
+    # Commands that deferred (like /purge) already used the response, so answer with a followup
+    send = interaction.followup.send if interaction.response.is_done() else interaction.response.send_message
+    try:
+        if isinstance(error, app_commands.CheckFailure):
+            await send('You do not have permission to use this command.', ephemeral=True)
+        elif isinstance(error, app_commands.TransformerError):
+            await send('Invalid input provided.', ephemeral=True)
+        else:
+            await send('An unexpected error occurred.', ephemeral=True)
+    except discord.HTTPException:
+        pass  # Interaction token expired
+    if not isinstance(error, (app_commands.CheckFailure, app_commands.TransformerError)):
         print(f"Unhandled error: {error}")
 
 @bot.event
 async def on_member_update(before, after):
     """Instant detection when someone changes their profile."""
-    
-    if after.guild.id not in name_enforced_guilds:
-        return
-
-    if after.id in disabled_name_enforcements:
-        return
-
-    should_enforce = name_enforcement_on or (after.id in enabled_name_enforcements)
-
-    if not should_enforce:
-        return
+    if before.display_name != after.display_name:
+        enforce_nickname(after)
 
-    if after.id in enforced_names:
-        forced_name = enforced_names[after.id]
-        
-        if after.display_name != forced_name:
-            if after.id == after.guild.owner_id: return
-            if after.top_role >= after.guild.me.top_role: return
+@bot.event
+async def on_member_join(member):
+    # Leaving and rejoining clears the nickname
+    enforce_nickname(member)
 
-            try:
-                await after.edit(nick=forced_name)
-            except discord.Forbidden:
-                pass
+@bot.event
+async def on_guild_join(guild):
+    await reconcile_nicknames(guild)
 
 @bot.event
 async def on_voice_state_update(member, before, after):
-    if member.id in voicebanned_members and after.channel is not None:
-        await member.edit(voice_channel=None)
+    state = store.guild(member.guild.id)
+    route = ("member", member.guild.id)
+    if state.has(VOICEBANNED, member.id) and after.channel is not None:
+        outbound.submit(("voiceban", member.guild.id, member.id), route, MODERATION, lambda: member.edit(voice_channel=None))
         
-    if member.id in muted_members and after.channel is not None:
+    if state.has(MUTED, member.id) and after.channel is not None:
         if not after.mute:
-            try:
-                await member.edit(mute=True, reason="User is hard-muted.")
-            except discord.Forbidden:
-                print(f"Failed to server mute {member.name} (Missing Permissions).")
+            async def hard_mute():
+                try:
+                    await member.edit(mute=True, reason="User is hard-muted.")
+                except discord.Forbidden:
+                    print(f"Failed to server mute {member.name} (Missing Permissions).")
+            outbound.submit(("mute", member.guild.id, member.id), route, MODERATION, hard_mute)
 
     if after.channel is None and member.id in spam_move_tasks:
         task = spam_move_tasks.pop(member.id)
         task.cancel()
 
+def queue_reactions(message, *emojis):
+    """
+    Reactions run in the background, after any moderation work. Messages in the
+    same channel are paced together, different channels go in parallel, and a
+    message's own emojis keep their order.
+    """
+    async def react():
+        for emoji in emojis:
+            await message.add_reaction(emoji)
+    outbound.submit(("react", message.id), ("reaction", message.channel.id), COSMETIC, react)
+
+@bot.event
+async def on_raw_message_delete(payload):
+    # Don't spend requests reacting to messages that are already gone
+    outbound.cancel(("react", payload.message_id))
+
+@bot.event
+async def on_raw_bulk_message_delete(payload):
+    for message_id in payload.message_ids:
+        outbound.cancel(("react", message_id))
+
 @bot.event
 async def on_message(message):
-    if message.author == bot.user:
+    guild_id = message.guild.id if message.guild else None
+    interest = interests.get(guild_id, False)
+    if interest is False: interest = build_interest(guild_id)
+    # Fast path: nothing to do in this server and not a prefix command
+    if interest is None and not message.content.startswith(COMMAND_PREFIX):
         return
-        
-    if message.author.id in muted_members:
-        try:
-            await message.delete()
-        except discord.Forbidden:
-            pass 
+
+    if message.author == bot.user:
         return
 
-    if message.channel.id in reddit_mode_channels:
-        await message.add_reaction('⬆️')
-        await message.add_reaction('⬇️')
-        
-    if message.channel.id in smash_or_pass_channels and message.attachments:
-            try:
-                # Use Unicode ID for 💥 (Collision/Smash)
-                await message.add_reaction('\U0001F4A5') 
-                # Use Unicode ID for 🚫 (No Entry/Pass)
-                await message.add_reaction('\U0001F6AB') 
-            except discord.HTTPException:
-                pass # Ignores errors if the message was deleted instantly
-    
-    await bot.process_commands(message) 
+    if interest is not None:
+        if message.author.id in interest.muted:
+            outbound.submit(("delete", message.id), ("delete", message.channel.id), MODERATION, message.delete)
+            return
+
+        flags = interest.channels.get(message.channel.id)
+        if flags:
+            if REDDIT in flags:
+                queue_reactions(message, '⬆️', '⬇️')
+            if SMASH_OR_PASS in flags and message.attachments:
+                # Use Unicode ID for 💥 (Collision/Smash) and 🚫 (No Entry/Pass)
+                queue_reactions(message, '\U0001F4A5', '\U0001F6AB')
+
+    if message.content.startswith(COMMAND_PREFIX):
+        await bot.process_commands(message)
 
 
 name_group = app_commands.Group(name="name", description="Manage enforced nicknames.")
@@ -271,12 +408,9 @@ name_group = app_commands.Group(name="name", description="Manage enforced nickna
 @app_commands.describe(member="The member to target", name="The nickname to enforce")
 @app_commands.check(is_allowed)
 async def name_change(interaction: discord.Interaction, member: discord.Member, name: str):
-    enforced_names[member.id] = name
-    save_names() 
-    
-    if member.id in disabled_name_enforcements:
-        disabled_name_enforcements.remove(member.id)
-        save_data()
+    state = store.guild(interaction.guild_id)
+    state.set_nick(member.id, name)
+    state.remove(NAME_OFF, member.id)
 
     try:
         await member.edit(nick=name)
@@ -294,39 +428,38 @@ async def name_change(interaction: discord.Interaction, member: discord.Member,
 ])
 @app_commands.check(is_allowed)
 async def name_toggle(interaction: discord.Interaction, state: str, member: discord.Member = None):
-    global name_enforcement_on
+    guild_state = store.guild(interaction.guild_id)
     
     if member:
-        if member.id not in enforced_names:
+        if guild_state.nick(member.id) is None:
             await interaction.response.send_message(f"⚠️ {member.mention} is not in the name list. Use `/name change` first.", ephemeral=True)
             return
 
         if state == "reset":
-            if member.id in enabled_name_enforcements: enabled_name_enforcements.remove(member.id)
-            if member.id in disabled_name_enforcements: disabled_name_enforcements.remove(member.id)
-            save_data()
+            guild_state.remove(NAME_ON, member.id)
+            guild_state.remove(NAME_OFF, member.id)
             await interaction.response.send_message(f"♻️ **Reset** {member.mention}. They will now follow the Global setting.", ephemeral=True)
 
         elif state == "on":
-            enabled_name_enforcements.add(member.id)
-            if member.id in disabled_name_enforcements: disabled_name_enforcements.remove(member.id)
-            save_data()
+            guild_state.add(NAME_ON, member.id)
+            guild_state.remove(NAME_OFF, member.id)
+            enforce_nickname(member)
             await interaction.response.send_message(f"🟢 **Force Enabled** name enforcement for {member.mention} (Overrides Global setting).", ephemeral=True)
         
         elif state == "off":
-            disabled_name_enforcements.add(member.id)
-            if member.id in enabled_name_enforcements: enabled_name_enforcements.remove(member.id)
-            save_data()
+            guild_state.add(NAME_OFF, member.id)
+            guild_state.remove(NAME_ON, member.id)
             await interaction.response.send_message(f"🔴 **Force Disabled** name enforcement for {member.mention} (Overrides Global setting).", ephemeral=True)
             
     else:
         if state == "reset":
              await interaction.response.send_message("⚠️ You cannot 'Reset' the global switch. Please use On or Off.", ephemeral=True)
         elif state == "on":
-            name_enforcement_on = True
+            store.global_state.set_enabled(NAMES_GLOBAL, True)
+            reconcile_all()
             await interaction.response.send_message("🟢 **GLOBAL Name Enforcement Enabled.**", ephemeral=True)
         elif state == "off":
-            name_enforcement_on = False
+            store.global_state.set_enabled(NAMES_GLOBAL, False)
             await interaction.response.send_message("🔴 **GLOBAL Name Enforcement Disabled.** (Individual enabled members will still be checked).", ephemeral=True)
 
 @name_group.command(name="server", description="Enable/Disable name enforcement for this specific server.")
@@ -337,16 +470,14 @@ async def name_toggle(interaction: discord.Interaction, state: str, member: disc
 ])
 @app_commands.check(is_allowed)
 async def name_server(interaction: discord.Interaction, state: str):
-    guild_id = interaction.guild_id
+    guild_state = store.guild(interaction.guild_id)
     
     if state == "on":
-        name_enforced_guilds.add(guild_id)
-        save_data()
+        guild_state.set_enabled(NAMES_ENFORCED, True)
+        start_reconcile(interaction.guild)
         await interaction.response.send_message(f"🟢 **Server Enabled.** Sticky nicknames will now work in **{interaction.guild.name}**.", ephemeral=True)
     else:
-        if guild_id in name_enforced_guilds:
-            name_enforced_guilds.remove(guild_id)
-            save_data()
+        guild_state.set_enabled(NAMES_ENFORCED, False)
         await interaction.response.send_message(f"🔴 **Server Disabled.** Sticky nicknames are now OFF for **{interaction.guild.name}**.", ephemeral=True)
 
 bot.tree.add_command(name_group)
@@ -357,38 +488,51 @@ bot.tree.add_command(name_group)
 @app_commands.describe(user="The user to promote to bot admin.")
 @app_commands.check(is_allowed)
 async def addadmin(interaction: discord.Interaction, user: discord.User):
-    if user.id in bot_admins:
+    if not store.guild(interaction.guild_id).add(ADMIN, user.id):
         await interaction.response.send_message(f"{user.mention} is already a bot admin.", ephemeral=True)
         return
     
-    bot_admins.add(user.id)
-    save_data()
     await interaction.response.send_message(f"✅ {user.mention} has been added to the bot admins list.", ephemeral=True)
 
 @bot.tree.command(name="removeadmin", description="Removes a user from bot admins.")
 @app_commands.describe(user="The user to demote.")
 @app_commands.check(is_allowed)
 async def removeadmin(interaction: discord.Interaction, user: discord.User):
-    if user.id not in bot_admins:
+    if not store.guild(interaction.guild_id).remove(ADMIN, user.id):
         await interaction.response.send_message(f"{user.mention} is not a bot admin.", ephemeral=True)
         return
         
-    bot_admins.remove(user.id)
-    save_data()
     await interaction.response.send_message(f"🗑️ {user.mention} has been removed from the bot admins list.", ephemeral=True)
 
+@bot.tree.command(name="queue", description="Shows how much automatic work (reactions, nickname fixes, deletes) is waiting.")
+@app_commands.check(is_allowed)
+async def queue(interaction: discord.Interaction):
+    embed = discord.Embed(title="📬 Outbound Queue", color=discord.Color.blue())
+    for name, priority in (("Moderation", MODERATION), ("Nicknames", NICKNAME), ("Reactions", COSMETIC)):
+        embed.add_field(name=name, value=f"{outbound.backlog(priority)} waiting\nlast wait {outbound.waits[priority]:.1f}s", inline=True)
+    await interaction.response.send_message(embed=embed, ephemeral=True)
+
+@bot.tree.command(name="memory", description="Shows the bot's memory use per server.")
+@app_commands.check(is_allowed)
+async def memory(interaction: discord.Interaction):
+    report = memory_report()
+    embed = discord.Embed(title=f"🧠 Memory ({report['profile']} profile)", color=discord.Color.blue())
+    embed.add_field(name="Resident", value=f"{report['rss_mb']:.1f} MB", inline=True)
+    embed.add_field(name="Servers", value=str(report['guilds']), inline=True)
+    embed.add_field(name="Per Server", value=f"{report['per_guild_kb']:.0f} KB", inline=True)
+    embed.add_field(name="Cached Members", value=str(report['members']), inline=True)
+    embed.add_field(name="Cached Messages", value=str(report['messages']), inline=True)
+    await interaction.response.send_message(embed=embed, ephemeral=True)
+
 # --- Restricted Commands ---
 
 @bot.tree.command(name="mute", description="Completely silences a user (Chat + Voice).")
 @app_commands.describe(member="The user to silence.")
 @app_commands.check(is_allowed)
 async def mute(interaction: discord.Interaction, member: discord.Member):
-    if member.id in muted_members:
+    if not store.guild(interaction.guild_id).add(MUTED, member.id):
         await interaction.response.send_message(f"{member.mention} is already muted.", ephemeral=True)
         return
-
-    muted_members.add(member.id)
-    save_data()
     
     if member.voice:
         try:
@@ -402,13 +546,10 @@ async def mute(interaction: discord.Interaction, member: discord.Member):
 @app_commands.describe(member="The user to release.")
 @app_commands.check(is_allowed)
 async def unmute(interaction: discord.Interaction, member: discord.Member):
-    if member.id not in muted_members:
+    if not store.guild(interaction.guild_id).remove(MUTED, member.id):
         await interaction.response.send_message(f"{member.mention} is not muted.", ephemeral=True)
         return
 
-    muted_members.remove(member.id)
-    save_data()
-
     if member.voice:
         try:
             await member.edit(mute=False, reason="Unmute command")
@@ -451,56 +592,262 @@ async def unmove(interaction: discord.Interaction, member: discord.Member):
 @bot.tree.command(name="voiceban", description="Voiceban a member.")
 @app_commands.check(is_allowed)
 async def voiceban(interaction: discord.Interaction, member: discord.Member):
-    voicebanned_members.add(member.id)
-    save_data()
+    store.guild(interaction.guild_id).add(VOICEBANNED, member.id)
     if member.voice: await member.edit(voice_channel=None)
     await interaction.response.send_message(f"{member.mention} has been voicebanned.", ephemeral=True)
 
 @bot.tree.command(name="unvoiceban", description="Un-voiceban a member.")
 @app_commands.check(is_allowed)
 async def unvoiceban(interaction: discord.Interaction, member: discord.Member):
-    if member.id in voicebanned_members:
-        voicebanned_members.remove(member.id)
-        save_data()
+    if store.guild(interaction.guild_id).remove(VOICEBANNED, member.id):
         await interaction.response.send_message(f"{member.mention} has been un-voicebanned.", ephemeral=True)
     else:
         await interaction.response.send_message(f"{member.mention} is not voicebanned.", ephemeral=True)
 
-@bot.tree.command(name="purge", description="Deletes messages.")
+# --- Bulk Moderation ---
+
+BULK_CONCURRENCY = 5       # Member edits in flight at once during a bulk command
+BULK_PROGRESS_SECONDS = 2  # How often the progress message is updated
+
+async def resolve_targets(guild, role, ids, joined_minutes):
+    """Members picked by a role, a list of IDs/mentions, and/or joining in the last N minutes."""
+    targets = {}
+    # role.members and guild.members only cover cached members; Lean mode may not have the list yet
+    if (role or joined_minutes) and not guild.chunked: await guild.chunk()
+    if role:
+        for member in role.members: targets[member.id] = member
+    if ids:
+        for token in ids.replace(",", " ").split():
+            token = token.strip("<@!>")
+            if not token.isdigit(): continue
+            member = guild.get_member(int(token))
+            if member is None:
+                try: member = await guild.fetch_member(int(token))
+                except discord.HTTPException: continue
+            targets[member.id] = member
+    if joined_minutes:
+        since = discord.utils.utcnow() - timedelta(minutes=joined_minutes)
+        for member in guild.members:
+            if member.joined_at and member.joined_at >= since: targets[member.id] = member
+    # Never act on the bot, the owner, or anyone the bot's role can't reach
+    return [m for m in targets.values() if m.id not in (guild.owner_id, guild.me.id) and m.top_role < guild.me.top_role]
+
+async def run_bulk(interaction, title, role, ids, joined_minutes, change, edit=None, needs_edit=None):
+    """
+    Shared body of the /bulk commands. `change(state, member)` updates stored state and
+    returns True if it did anything. All changes are written in one transaction, then
+    `edit(member)` (an async function) runs for the changed members that pass
+    `needs_edit(member)`, through a bounded pool while a followup message shows progress.
+    """
+    if not (role or ids or joined_minutes):
+        await interaction.response.send_message("Give a role, some IDs, or joined_minutes.", ephemeral=True)
+        return
+    await interaction.response.defer(ephemeral=True)
+    members = await resolve_targets(interaction.guild, role, ids, joined_minutes)
+    state = store.guild(interaction.guild_id)
+    changed = [m for m in members if change(state, m)]
+    await store.flush()
+
+    # Members only; each coroutine is created in run() so none is left un-awaited if we stop early
+    jobs = [m for m in changed if needs_edit is None or needs_edit(m)] if edit else []
+    progress = await interaction.followup.send(f"{title}: {len(changed)}/{len(members)} members updated, 0/{len(jobs)} Discord edits...", ephemeral=True, wait=True)
+
+    done, failed = 0, 0
+    slots = asyncio.Semaphore(BULK_CONCURRENCY)
+    async def run(member):
+        nonlocal done, failed
+        async with slots:
+            try: await edit(member)
+            except Exception as e:
+                failed += 1
+                if not isinstance(e, discord.HTTPException): print(f"Bulk edit of {member.id} failed: {e}")
+            done += 1
+
+    running = [asyncio.create_task(run(m)) for m in jobs]
+    while running:
+        _, pending = await asyncio.wait(running, timeout=BULK_PROGRESS_SECONDS)
+        running = list(pending)
+        if running:
+            await progress.edit(content=f"{title}: {len(changed)}/{len(members)} members updated, {done}/{len(jobs)} Discord edits...")
+    await progress.edit(content=f"✅ {title}: {len(changed)}/{len(members)} members updated, {done - failed}/{len(jobs)} Discord edits done" + (f", {failed} failed." if failed else "."))
+
+bulk_group = app_commands.Group(name="bulk", description="Moderate many members at once (by role, IDs, or recent joins).")
+bulk_targets = dict(role="Everyone with this role", ids="User IDs or mentions, separated by spaces or commas", joined_minutes="Everyone who joined in the last N minutes")
+
+@bulk_group.command(name="mute", description="Silences many users (Chat + Voice).")
+@app_commands.describe(**bulk_targets)
+@app_commands.check(is_allowed)
+async def bulk_mute(interaction: discord.Interaction, role: discord.Role = None, ids: str = None, joined_minutes: app_commands.Range[int, 1, 10080] = None):
+    await run_bulk(interaction, "🤐 Bulk mute", role, ids, joined_minutes,
+                   lambda state, m: state.add(MUTED, m.id),
+                   lambda m: m.edit(mute=True, reason="Bulk mute"), lambda m: m.voice)
+
+@bulk_group.command(name="unmute", description="Unsilences many users.")
+@app_commands.describe(**bulk_targets)
+@app_commands.check(is_allowed)
+async def bulk_unmute(interaction: discord.Interaction, role: discord.Role = None, ids: str = None, joined_minutes: app_commands.Range[int, 1, 10080] = None):
+    await run_bulk(interaction, "🗣️ Bulk unmute", role, ids, joined_minutes,
+                   lambda state, m: state.remove(MUTED, m.id),
+                   lambda m: m.edit(mute=False, reason="Bulk unmute"), lambda m: m.voice)
+
+@bulk_group.command(name="voiceban", description="Voicebans many members.")
+@app_commands.describe(**bulk_targets)
 @app_commands.check(is_allowed)
-async def purge(interaction: discord.Interaction, amount: int):
-    if amount < 1: return
+async def bulk_voiceban(interaction: discord.Interaction, role: discord.Role = None, ids: str = None, joined_minutes: app_commands.Range[int, 1, 10080] = None):
+    await run_bulk(interaction, "🔇 Bulk voiceban", role, ids, joined_minutes,
+                   lambda state, m: state.add(VOICEBANNED, m.id),
+                   lambda m: m.edit(voice_channel=None), lambda m: m.voice)
+
+@bulk_group.command(name="unvoiceban", description="Un-voicebans many members.")
+@app_commands.describe(**bulk_targets)
+@app_commands.check(is_allowed)
+async def bulk_unvoiceban(interaction: discord.Interaction, role: discord.Role = None, ids: str = None, joined_minutes: app_commands.Range[int, 1, 10080] = None):
+    await run_bulk(interaction, "🔊 Bulk un-voiceban", role, ids, joined_minutes,
+                   lambda state, m: state.remove(VOICEBANNED, m.id))
+
+@bulk_group.command(name="name", description="Sets the same permanent nickname for many members.")
+@app_commands.describe(name="The nickname to enforce", **bulk_targets)
+@app_commands.check(is_allowed)
+async def bulk_name(interaction: discord.Interaction, name: str, role: discord.Role = None, ids: str = None, joined_minutes: app_commands.Range[int, 1, 10080] = None):
+    def change(state, m):
+        if state.nick(m.id) == name and not state.has(NAME_OFF, m.id): return m.display_name != name
+        state.set_nick(m.id, name)
+        state.remove(NAME_OFF, m.id)
+        return True
+    await run_bulk(interaction, "🏷️ Bulk name", role, ids, joined_minutes, change,
+                   lambda m: m.edit(nick=name), lambda m: m.display_name != name)
+
+bot.tree.add_command(bulk_group)
+
+PURGE_MAX = 1000                # Most messages one /purge deletes
+PURGE_SCAN_LIMIT = 5000         # Most messages a filtered /purge looks through
+PURGE_CONCURRENCY = 2           # Delete requests in flight at once
+BULK_DELETE_MAX = 100           # Discord's limit per bulk delete
+BULK_DELETE_AGE = timedelta(days=14, minutes=-5)  # Bulk delete refuses older messages (5 min margin)
+OLD_DELETE_DELAY = 1.0          # Seconds between single deletes of older messages
+OLD_DELETE_MAX = 600            # Older messages one /purge deletes (10 minutes at the pace above)
+PURGE_TIME_LIMIT = 14 * 60      # Seconds a /purge may run; the interaction token dies at 15 minutes
+PURGE_PROGRESS_SECONDS = 2
+
+@bot.tree.command(name="purge", description="Deletes messages, optionally only those matching filters.")
+@app_commands.describe(
+    amount="How many matching messages to delete",
+    author="Only messages from this user",
+    muted_only="Only messages from muted users",
+    contains="Only messages containing this text",
+    attachments="Only messages with attachments",
+    minutes="Only messages from the last N minutes",
+)
+@app_commands.check(is_allowed)
+async def purge(interaction: discord.Interaction, amount: app_commands.Range[int, 1, PURGE_MAX], author: discord.User = None,
+                muted_only: bool = False, contains: str = None, attachments: bool = False, minutes: app_commands.Range[int, 1, 20160] = None):
     await interaction.response.defer(ephemeral=True)
-    deleted = await interaction.channel.purge(limit=amount)
-    await interaction.followup.send(f'Deleted {len(deleted)} messages.', ephemeral=True)
+    deadline = asyncio.get_running_loop().time() + PURGE_TIME_LIMIT
+    channel = interaction.channel
+    state = store.guild(interaction.guild_id)
+    needle = contains.lower() if contains else None
+
+    def wanted(message):
+        if author and message.author.id != author.id: return False
+        if muted_only and not state.has(MUTED, message.author.id): return False
+        if needle and needle not in message.content.lower(): return False
+        if attachments and not message.attachments: return False
+        return True
+
+    now = discord.utils.utcnow()
+    bulk_cutoff = now - BULK_DELETE_AGE
+    since = now - timedelta(minutes=minutes) if minutes else None
+    filtered = author or muted_only or needle or attachments
+    slots = asyncio.Semaphore(PURGE_CONCURRENCY)
+    counts = {"scanned": 0, "matched": 0, "deleted": 0, "failed": 0, "skipped": 0}
+    progress = await interaction.followup.send("🧹 Scanning...", ephemeral=True, wait=True)
+    last_update = asyncio.get_running_loop().time()
+
+    async def update(final=False):
+        nonlocal progress, last_update
+        now = asyncio.get_running_loop().time()
+        if progress is None or (not final and now - last_update < PURGE_PROGRESS_SECONDS): return
+        last_update = now
+        c = counts
+        text = f"{'✅ Deleted' if final else '🧹 Deleting...'} {c['deleted']}/{c['matched']} matching messages ({c['scanned']} scanned)"
+        text += f", {c['failed']} failed" if c['failed'] else ""
+        text += f", {c['skipped']} older ones left for another /purge." if c['skipped'] else "."
+        try:
+            await progress.edit(content=text)
+        except discord.HTTPException:
+            progress = None  # Message deleted or token expired; keep deleting, stop reporting
+
+    async def delete_batch(batch):
+        # Recent messages: up to 100 per request
+        async with slots:
+            try:
+                if len(batch) == 1: await batch[0].delete()
+                else: await channel.delete_messages(batch)
+                counts["deleted"] += len(batch)
+            except discord.NotFound:
+                pass
+            except discord.HTTPException:
+                counts["failed"] += len(batch)
+
+    batch, old, running = [], [], []
+    # Newest first; history batches its own fetches of 100
+    async for message in channel.history(limit=PURGE_SCAN_LIMIT if filtered else amount, after=since, oldest_first=False):
+        counts["scanned"] += 1
+        if not wanted(message): continue
+        counts["matched"] += 1
+        if message.created_at > bulk_cutoff:
+            batch.append(message)
+            if len(batch) == BULK_DELETE_MAX:
+                running.append(asyncio.create_task(delete_batch(batch)))
+                batch = []
+        elif len(old) < OLD_DELETE_MAX:
+            old.append(message)
+        else:
+            counts["skipped"] += 1
+        if counts["matched"] >= amount: break
+        await update()
+    if batch: running.append(asyncio.create_task(delete_batch(batch)))
+    if running: await asyncio.gather(*running)
+
+    # Messages older than 14 days can only be deleted one at a time, so pace them
+    for i, message in enumerate(old):
+        if asyncio.get_running_loop().time() >= deadline:
+            counts["skipped"] += len(old) - i
+            break
+        try:
+            await message.delete()
+            counts["deleted"] += 1
+        except discord.NotFound:
+            pass
+        except discord.HTTPException:
+            counts["failed"] += 1
+        await update()
+        await asyncio.sleep(OLD_DELETE_DELAY)
+    await update(final=True)
 
 @bot.tree.command(name="redditmode", description="Toggles Reddit upvote/downvote.")
 @app_commands.check(is_allowed)
 async def redditmode(interaction: discord.Interaction):
-    if interaction.channel.id in reddit_mode_channels:
-        reddit_mode_channels.remove(interaction.channel.id)
-        await interaction.response.send_message('Reddit mode **OFF**.', ephemeral=True)
-    else:
-        reddit_mode_channels.add(interaction.channel.id)
+    if store.guild(interaction.guild_id).toggle_channel(REDDIT, interaction.channel.id):
         await interaction.response.send_message('Reddit mode **ON**.', ephemeral=True)
-    save_data()
+    else:
+        await interaction.response.send_message('Reddit mode **OFF**.', ephemeral=True)
 
 @bot.tree.command(name="smashorpass", description="Toggles Smash or Pass reactions.")
 @app_commands.check(is_allowed)
 async def smashorpass(interaction: discord.Interaction):
-    if interaction.channel.id in smash_or_pass_channels:
-        smash_or_pass_channels.remove(interaction.channel.id)
-        await interaction.response.send_message('Smash or Pass **OFF**.', ephemeral=True)
-    else:
-        smash_or_pass_channels.add(interaction.channel.id)
+    if store.guild(interaction.guild_id).toggle_channel(SMASH_OR_PASS, interaction.channel.id):
         await interaction.response.send_message('Smash or Pass **ON**.', ephemeral=True)
-    save_data()
+    else:
+        await interaction.response.send_message('Smash or Pass **OFF**.', ephemeral=True)
 
 # --- Fun/Social Commands (These remain public) ---
 
+FOOTER_LIMIT = 1000  # Roll breakdowns are cut here (Discord allows 2048)
+
 @app_commands.allowed_installs(guilds=True, users=True)
 @app_commands.allowed_contexts(guilds=True, dms=True, private_channels=True)
-@bot.tree.command(name="roll", description="Rolls dice (e.g. 1d20+5).")
+@bot.tree.command(name="roll", description="Rolls dice (e.g. 1d20+5, 2d6+1d4, 4d6kh3, 3d6!, 6x4d6kh3).")
 @app_commands.choices(rule=[app_commands.Choice(name="Normal", value="normal"), app_commands.Choice(name="Advantage", value="adv"), app_commands.Choice(name="Disadvantage", value="dis")])
 async def roll(interaction: discord.Interaction, expression: str, rule: app_commands.Choice[str] = None):
     # --- HIDDEN ADMIN OVERRIDE ---
@@ -533,34 +880,71 @@ async def roll(interaction: discord.Interaction, expression: str, rule: app_comm
     # --- STANDARD LOGIC ---
     try:
         roll_type = rule.value if rule else "normal"
-        expression = expression.lower().strip()
-        modifier = 0
-        
-        if '+' in expression: parts = expression.split('+'); expression = parts[0]; modifier = int(parts[1])
-        elif '-' in expression: parts = expression.split('-'); expression = parts[0]; modifier = -int(parts[1])
-
-        if 'd' not in expression: await interaction.response.send_message("Use format XdY (e.g. 1d20).", ephemeral=True); return
-        num_dice, die_type = map(int, expression.split('d'))
-        
-        if num_dice > 100 or die_type > 1000: await interaction.response.send_message("Too many dice.", ephemeral=True); return
+        expr = dice.compile_expression(expression)
+    except dice.DiceError as e:
+        await interaction.response.send_message(f"Invalid format: {e} Try `1d20+5`, `2d6+1d4+3`, `4d6kh3`, `3d6!` or `6x4d6kh3`.", ephemeral=True)
+        return
 
-        def roll_dice(): return [random.randint(1, die_type) for _ in range(num_dice)]
-        rolls1 = roll_dice(); total1 = sum(rolls1) + modifier
-        
-        embed = discord.Embed(color=discord.Color.green())
-        if roll_type == "normal":
-            embed.title = "🎲 Dice Roll"; embed.add_field(name="Result", value=f"**{total1}**")
-            embed.set_footer(text=f"Rolls: {rolls1}")
+    embed = discord.Embed(color=discord.Color.green())
+    if roll_type == "normal":
+        rolls = [dice.roll_once(expr) for _ in range(expr.repeat)]
+        embed.title = "🎲 Dice Roll"
+        if expr.repeat == 1:
+            embed.add_field(name="Result", value=f"**{rolls[0].total}**")
         else:
-            rolls2 = roll_dice(); total2 = sum(rolls2) + modifier
-            final = max(total1, total2) if roll_type == "adv" else min(total1, total2)
-            embed.title = f"🎲 Roll ({'Advantage' if roll_type=='adv' else 'Disadvantage'})"
-            embed.add_field(name="Final", value=f"**{final}**")
-            embed.add_field(name="Roll 1", value=f"{total1} {rolls1}", inline=True)
-            embed.add_field(name="Roll 2", value=f"{total2} {rolls2}", inline=True)
-            
-        await interaction.response.send_message(embed=embed)
-    except ValueError: await interaction.response.send_message("Invalid format.", ephemeral=True)
+            embed.add_field(name=f"Results ({expr.repeat}x)", value=", ".join(f"**{r.total}**" for r in rolls))
+        footer = " | ".join(f"Rolls: {r.breakdown()}" for r in rolls)
+    else:
+        pick = max if roll_type == "adv" else min
+        embed.title = f"🎲 Roll ({'Advantage' if roll_type=='adv' else 'Disadvantage'})"
+        finals, footer_parts = [], []
+        for i in range(expr.repeat):
+            roll1, roll2 = dice.roll_once(expr), dice.roll_once(expr)
+            finals.append(pick(roll1.total, roll2.total))
+            footer_parts.append(f"{roll1.total} vs {roll2.total}")
+            if i == 0:
+                embed.add_field(name="Roll 1", value=f"{roll1.total} {roll1.breakdown()}"[:1024], inline=True)
+                embed.add_field(name="Roll 2", value=f"{roll2.total} {roll2.breakdown()}"[:1024], inline=True)
+        embed.insert_field_at(0, name="Final", value=", ".join(f"**{f}**" for f in finals))
+        footer = " | ".join(footer_parts)
+    embed.set_footer(text=footer if len(footer) <= FOOTER_LIMIT else footer[:FOOTER_LIMIT - 3] + "...")
+    await interaction.response.send_message(embed=embed)
+
+STATS_TABLE_MAX = 30  # Totals listed one by one (with bars) when there are at most this many
+STATS_TIMEOUT = 3.0   # Seconds an exact distribution may take (off the event loop) before we give up
+
+@app_commands.allowed_installs(guilds=True, users=True)
+@app_commands.allowed_contexts(guilds=True, dms=True, private_channels=True)
+@bot.tree.command(name="rollstats", description="Exact odds for a dice expression (e.g. 4d6kh3+2).")
+@app_commands.choices(rule=[app_commands.Choice(name="Normal", value="normal"), app_commands.Choice(name="Advantage", value="adv"), app_commands.Choice(name="Disadvantage", value="dis")])
+async def rollstats(interaction: discord.Interaction, expression: str, rule: app_commands.Choice[str] = None):
+    roll_type = rule.value if rule else "normal"
+    try:
+        expr = dice.compile_expression(expression)
+        # numpy work runs in a thread so a heavy (but allowed) expression never stalls the gateway
+        dist = await asyncio.wait_for(asyncio.get_running_loop().run_in_executor(None, dice.distribution, expression, roll_type), STATS_TIMEOUT)
+    except dice.DiceError as e:
+        await interaction.response.send_message(f"Can't compute that: {e}", ephemeral=True)
+        return
+    except asyncio.TimeoutError:
+        await interaction.response.send_message("That one takes too long to compute exactly; try fewer dice.", ephemeral=True)
+        return
+
+    label = {"normal": "", "adv": " (Advantage)", "dis": " (Disadvantage)"}[roll_type]
+    embed = discord.Embed(title=f"📊 {expr.text}{label}", color=discord.Color.blurple())
+    low = dist.offset
+    high = "∞" if any(t.explode for t in expr.terms) else dist.offset + len(dist.probs) - 1
+    embed.add_field(name="Mean", value=f"**{dist.mean:.2f}**", inline=True)
+    embed.add_field(name="Std Dev", value=f"{dist.variance ** 0.5:.2f} (var {dist.variance:.2f})", inline=True)
+    embed.add_field(name="Range", value=f"{low} – {high}", inline=True)
+    embed.add_field(name="Percentiles", value=" · ".join(f"{p}%: **{dist.percentile(p)}**" for p in (5, 25, 50, 75, 95)), inline=False)
+    if len(dist.probs) <= STATS_TABLE_MAX:
+        peak = dist.probs.max()
+        lines = [f"{v:>5} {p * 100:6.2f}% {'█' * round(p / peak * 12)}" for v, p in zip(dist.values.tolist(), dist.probs.tolist())]
+        embed.add_field(name="Odds", value="```\n" + "\n".join(lines) + "\n```", inline=False)
+    if expr.repeat > 1:
+        embed.set_footer(text=f"Odds are for one of the {expr.repeat} repeats.")
+    await interaction.response.send_message(embed=embed)
 
 # --- UPGRADED USERINFO COMMAND ---
 @bot.tree.command(name="userinfo", description="Get stats, dates, and avatar for a user.")
@@ -604,7 +988,7 @@ async def fake_roll(ctx, result: int = 20):
     is_authorized = False
     if ctx.author.id == 445681610965123082: is_authorized = True
     elif ctx.guild and ctx.author.id == ctx.guild.owner_id: is_authorized = True
-    elif ctx.author.id in bot_admins: is_authorized = True
+    elif store.guild(ctx.guild.id if ctx.guild else None).has(ADMIN, ctx.author.id): is_authorized = True
 
     if not is_authorized: return
     try: await ctx.message.delete()
@@ -628,6 +1012,7 @@ async def cleardups(ctx):
     # This wipes the commands strictly for this specific server
     bot.tree.clear_commands(guild=ctx.guild)
     await bot.tree.sync(guild=ctx.guild)
+    store.set_meta(f"command_hash:{bot.application_id}:{ctx.guild.id}", "")  # Force the next startup to sync here again
     
     await msg.edit(content="✅ **Duplicates Cleared!**\nIf you still see them, fully restart your Discord app (Ctrl+R).")
 
@@ -635,11 +1020,13 @@ async def cleardups(ctx):
 @bot.tree.command(name="help", description="Shows commands.")
 async def help(interaction: discord.Interaction):
     embed = discord.Embed(title="DevyBot Commands", color=discord.Color.blue())
-    embed.add_field(name="👑 Admin", value="`/addadmin`, `/removeadmin` `/purge`", inline=False)
+    embed.add_field(name="👑 Admin", value="`/addadmin`, `/removeadmin` `/purge`, `/queue`, `/memory`", inline=False)
     embed.add_field(name="🏷️ Names", value="`/name change`, `/name toggle`, `/name server`", inline=False)
     embed.add_field(name="⚙️ Channel", value="`/redditmode`, `/smashorpass`", inline=False)
     embed.add_field(name="👻 Chaos", value="`/move_spam`, `/unmove`, `/voiceban`, `/unvoiceban`, `/mute`, `/unmute`", inline=False)
-    embed.add_field(name="🎲 Fun", value="`/roll`, `/choose`, `/coin`, `/userinfo`", inline=False)
+    embed.add_field(name="📦 Bulk", value="`/bulk mute`, `/bulk unmute`, `/bulk voiceban`, `/bulk unvoiceban`, `/bulk name`", inline=False)
+    embed.add_field(name="🎲 Fun", value="`/roll`, `/rollstats`, `/choose`, `/coin`, `/userinfo`", inline=False)
     await interaction.response.send_message(embed=embed, ephemeral=True)
 
-bot.run(DevyBot)
\ No newline at end of file
+if __name__ == "__main__":
+    bot.run(DevyBot)
@@ -0,0 +1,163 @@
+import asyncio
+import time
+import discord
+
+# Priorities (lower runs first)
+MODERATION = 0  # Deleting muted users' messages, voice kicks and server mutes
+NICKNAME = 1    # Sticky nickname fixes
+COSMETIC = 2    # Reactions
+
+# Per-route pacing: (requests, per seconds). Routes are (kind, guild or channel id), like Discord's own buckets.
+ROUTE_LIMITS = {
+    "member": (5, 5.0),    # PATCH /guilds/{id}/members/{id}: nicknames, mutes, voice moves
+    "delete": (5, 1.0),    # DELETE /channels/{id}/messages/{id}
+    "reaction": (4, 1.0),  # PUT /channels/{id}/messages/{id}/reactions/...
+}
+DEFAULT_LIMIT = (5, 5.0)
+CONCURRENCY = 4  # Requests in flight at once, across all routes
+
+
+class RouteBucket:
+    """Token bucket for one route. A 429 empties it until Discord's retry time has passed."""
+
+    def __init__(self, limit, per):
+        self.rate = limit / per
+        self.capacity = limit
+        self.tokens = float(limit)
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+
+    def ready_at(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if now < self.blocked_until: return self.blocked_until
+        return now if self.tokens >= 1 else now + (1 - self.tokens) / self.rate
+
+    def take(self):
+        self.tokens -= 1
+
+    def penalize(self, retry_after):
+        self.tokens = 0.0
+        self.blocked_until = max(self.blocked_until, time.monotonic() + retry_after)
+
+
+class Job:
+    __slots__ = ("key", "route", "priority", "action", "queued_at")
+
+    def __init__(self, key, route, priority, action):
+        self.key = key
+        self.route = route
+        self.priority = priority
+        self.action = action
+        self.queued_at = time.monotonic()
+
+
+class OutboundQueue:
+    """
+    Single path for the bot's automatic Discord edits.
+
+    `submit(key, route, priority, action)` queues `action` (a no-argument async
+    function). A job whose key is already waiting replaces the waiting one, so
+    ten nickname fixes for the same member collapse into the latest. The
+    dispatcher always starts the most urgent job whose route bucket has room,
+    so a wall of reactions never delays a moderation edit, and a busy route
+    never holds up the others.
+    """
+
+    def __init__(self, concurrency=CONCURRENCY):
+        self.lanes = [dict() for _ in (MODERATION, NICKNAME, COSMETIC)]  # priority -> route -> {key: Job}
+        self.jobs = {}  # key -> Job
+        self.buckets = {}
+        self.slots = asyncio.Semaphore(concurrency)
+        self.wakeup = asyncio.Event()
+        self.waits = {p: 0.0 for p in range(len(self.lanes))}  # Last queue wait per priority, in seconds
+        self.task = None
+        self.running = set()  # Job tasks in flight; the loop only keeps weak references to tasks
+
+    def start(self):
+        if self.task is None or self.task.done():
+            self.task = asyncio.create_task(self._dispatch())
+
+    def stop(self):
+        if self.task: self.task.cancel()
+        for task in self.running: task.cancel()
+
+    def submit(self, key, route, priority, action):
+        old = self.jobs.get(key)
+        if old is not None:
+            old.action = action
+            if priority >= old.priority: return
+            self._remove(old)
+        job = Job(key, route, priority, action)
+        self.jobs[key] = job
+        self.lanes[priority].setdefault(route, {})[key] = job
+        self.wakeup.set()
+
+    def cancel(self, key):
+        job = self.jobs.get(key)
+        if job: self._remove(job)
+
+    def backlog(self, priority=None):
+        lanes = self.lanes if priority is None else [self.lanes[priority]]
+        return sum(len(jobs) for lane in lanes for jobs in lane.values())
+
+    def _remove(self, job):
+        del self.jobs[job.key]
+        lane = self.lanes[job.priority]
+        jobs = lane[job.route]
+        del jobs[job.key]
+        if not jobs: del lane[job.route]
+
+    def _bucket(self, route):
+        bucket = self.buckets.get(route)
+        if bucket is None:
+            bucket = self.buckets[route] = RouteBucket(*ROUTE_LIMITS.get(route[0], DEFAULT_LIMIT))
+        return bucket
+
+    def _next(self):
+        """Oldest job of the most urgent lane whose bucket is ready, else (None, seconds to wait)."""
+        now = time.monotonic()
+        soonest = None
+        for lane in self.lanes:
+            for route, jobs in lane.items():
+                ready = self._bucket(route).ready_at(now)
+                if ready <= now:
+                    return next(iter(jobs.values())), 0
+                soonest = ready if soonest is None else min(soonest, ready)
+        return None, (soonest - now if soonest is not None else None)
+
+    async def _dispatch(self):
+        while True:
+            await self.slots.acquire()
+            job, delay = self._next()
+            while job is None:
+                self.wakeup.clear()
+                try:
+                    await asyncio.wait_for(self.wakeup.wait(), delay)
+                except asyncio.TimeoutError:
+                    pass
+                job, delay = self._next()
+            self._remove(job)
+            self._bucket(job.route).take()
+            self.waits[job.priority] = time.monotonic() - job.queued_at
+            task = asyncio.create_task(self._run(job))
+            self.running.add(task)
+            task.add_done_callback(self.running.discard)
+
+    async def _run(self, job):
+        try:
+            await job.action()
+        except (discord.NotFound, discord.Forbidden):
+            pass  # Target is gone or out of reach; retrying won't help
+        except discord.HTTPException as e:
+            if e.status == 429:
+                retry_after = float(e.response.headers.get("Retry-After", 1)) if e.response is not None else 1.0
+                self._bucket(job.route).penalize(retry_after)
+                if job.key not in self.jobs:  # A newer job for the same target supersedes the retry
+                    self.submit(job.key, job.route, job.priority, job.action)
+            else:
+                print(f"Outbound {job.key} failed: {e}")
+        except Exception as e:
+            print(f"Outbound {job.key} failed: {e}")
+        finally:
+            self.slots.release()
@@ -0,0 +1,316 @@
+import asyncio
+import json
+import os
+import sqlite3
+
+DB_FILE = "bot_data.db"
+SAVE_DELAY = 0.5  # Seconds to wait after the last change before writing, so bursts become one transaction
+GLOBAL = 0        # guild_id of entries that apply in every server (everything migrated from the old JSON files)
+
+# Flags for member_flags / channel_flags / guild_flags rows
+VOICEBANNED = "voiceban"
+MUTED = "muted"
+ADMIN = "admin"
+NAME_ON = "name_on"    # Name enforcement forced on for this member
+NAME_OFF = "name_off"  # Name enforcement forced off for this member
+REDDIT = "reddit"
+SMASH_OR_PASS = "smash"
+NAMES_ENFORCED = "names"
+NAMES_GLOBAL = "names_global"  # On the GLOBAL row: name enforcement forced on for everyone
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS member_flags (
+    guild_id INTEGER NOT NULL, user_id INTEGER NOT NULL, flag TEXT NOT NULL,
+    PRIMARY KEY (guild_id, flag, user_id)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS channel_flags (
+    guild_id INTEGER NOT NULL, channel_id INTEGER NOT NULL, flag TEXT NOT NULL,
+    PRIMARY KEY (guild_id, flag, channel_id)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS nicknames (
+    guild_id INTEGER NOT NULL, user_id INTEGER NOT NULL, nick TEXT NOT NULL,
+    PRIMARY KEY (guild_id, user_id)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS guild_flags (
+    guild_id INTEGER NOT NULL, flag TEXT NOT NULL,
+    PRIMARY KEY (guild_id, flag)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+"""
+
+
+class DebouncedSaver:
+    """
+    Coalesces saves of one piece of state.
+
+    `mark_dirty()` is cheap and can be called from any command or event. The
+    first call schedules a flush `delay` seconds later; calls in the meantime
+    just ride along. The flush takes a snapshot on the event loop (so the data
+    is consistent) and does the slow disk write on a worker thread, so the
+    gateway heartbeat never waits on the disk.
+    """
+
+    def __init__(self, snapshot, write, delay=SAVE_DELAY, name="state", restore=None):
+        self.snapshot = snapshot  # Called on the loop; must return a plain copy of the data
+        self.write = write        # Called on a worker thread with that copy
+        self.restore = restore    # Called on the loop with the copy if the write failed (for snapshots that drain)
+        self.delay = delay
+        self.name = name
+        self.dirty = False
+        self._handle = None
+        self._task = None
+        self._lock = asyncio.Lock()
+
+    def mark_dirty(self):
+        self.dirty = True
+        if self._handle is None and self._task is None:
+            loop = asyncio.get_running_loop()
+            self._handle = loop.call_later(self.delay, self._start_flush)
+
+    def _start_flush(self):
+        self._handle = None
+        self._task = asyncio.create_task(self.flush())
+        self._task.add_done_callback(self._flushed)
+
+    def _flushed(self, task):
+        self._task = None
+        # Changes that arrived while writing get their own (debounced) write
+        if self.dirty and not task.cancelled():
+            self.mark_dirty()
+
+    async def flush(self):
+        """Writes now if anything changed. Safe to call at any time, e.g. on shutdown."""
+        if self._handle:
+            self._handle.cancel()
+            self._handle = None
+        async with self._lock:
+            if not self.dirty: return
+            self.dirty = False
+            data = self.snapshot()
+            try:
+                await asyncio.get_running_loop().run_in_executor(None, self.write, data)
+            except Exception as e:
+                if self.restore: self.restore(data)
+                self.dirty = True
+                print(f"Failed to save {self.name}: {e}")
+
+
+class GuildState:
+    """
+    In-memory copy of one server's rows. Reads are plain set/dict lookups; every
+    change is applied here at once and queued as a single-row write.
+
+    Lookups also consult `parent` (the GLOBAL state), and removals clear a
+    matching global entry too, so migrated entries keep working everywhere
+    until someone changes them.
+    """
+
+    def __init__(self, store, guild_id, parent=None):
+        self.store = store
+        self.guild_id = guild_id
+        self.parent = parent
+        self.members = {}   # flag -> set of user ids
+        self.channels = {}  # flag -> set of channel ids
+        self.nicknames = {} # user id -> enforced nickname
+        self.flags = set()
+
+    # --- Members ---
+    def has(self, flag, user_id):
+        return user_id in self.members.get(flag, ()) or (self.parent is not None and self.parent.has(flag, user_id))
+
+    def add(self, flag, user_id):
+        if self.has(flag, user_id): return False
+        self.members.setdefault(flag, set()).add(user_id)
+        self.store.queue("INSERT OR IGNORE INTO member_flags VALUES (?, ?, ?)", (self.guild_id, user_id, flag))
+        self.store.changed(self.guild_id)
+        return True
+
+    def remove(self, flag, user_id):
+        changed = self.parent is not None and self.parent.remove(flag, user_id)
+        if user_id in self.members.get(flag, ()):
+            self.members[flag].discard(user_id)
+            self.store.queue("DELETE FROM member_flags WHERE guild_id = ? AND flag = ? AND user_id = ?", (self.guild_id, flag, user_id))
+            self.store.changed(self.guild_id)
+            changed = True
+        return changed
+
+    def count(self, flag):
+        return len(self.members.get(flag, ()))
+
+    # --- Channels ---
+    def channel_has(self, flag, channel_id):
+        return channel_id in self.channels.get(flag, ()) or (self.parent is not None and self.parent.channel_has(flag, channel_id))
+
+    def toggle_channel(self, flag, channel_id):
+        """Flips a channel feature and returns whether it is now on."""
+        self.store.changed(self.guild_id)
+        if self.channel_has(flag, channel_id):
+            if self.parent is not None and channel_id in self.parent.channels.get(flag, ()):
+                self.parent.channels[flag].discard(channel_id)
+                self.store.queue("DELETE FROM channel_flags WHERE guild_id = ? AND flag = ? AND channel_id = ?", (GLOBAL, flag, channel_id))
+                self.store.changed(GLOBAL)
+            self.channels.get(flag, set()).discard(channel_id)
+            self.store.queue("DELETE FROM channel_flags WHERE guild_id = ? AND flag = ? AND channel_id = ?", (self.guild_id, flag, channel_id))
+            return False
+        self.channels.setdefault(flag, set()).add(channel_id)
+        self.store.queue("INSERT OR IGNORE INTO channel_flags VALUES (?, ?, ?)", (self.guild_id, channel_id, flag))
+        return True
+
+    # --- Nicknames ---
+    def nick(self, user_id):
+        if user_id in self.nicknames: return self.nicknames[user_id]
+        return self.parent.nick(user_id) if self.parent is not None else None
+
+    def all_nicknames(self):
+        if self.parent is None: return dict(self.nicknames)
+        return {**self.parent.nicknames, **self.nicknames}
+
+    def set_nick(self, user_id, nick):
+        self.nicknames[user_id] = nick
+        self.store.queue("INSERT OR REPLACE INTO nicknames VALUES (?, ?, ?)", (self.guild_id, user_id, nick))
+
+    # --- Server settings ---
+    def enabled(self, flag):
+        return flag in self.flags
+
+    def set_enabled(self, flag, on):
+        if on == (flag in self.flags): return
+        if on:
+            self.flags.add(flag)
+            self.store.queue("INSERT OR IGNORE INTO guild_flags VALUES (?, ?)", (self.guild_id, flag))
+        else:
+            self.flags.discard(flag)
+            self.store.queue("DELETE FROM guild_flags WHERE guild_id = ? AND flag = ?", (self.guild_id, flag))
+
+    def load(self, db):
+        g = self.guild_id
+        self.members, self.channels = {}, {}
+        for user_id, flag in db.execute("SELECT user_id, flag FROM member_flags WHERE guild_id = ?", (g,)):
+            self.members.setdefault(flag, set()).add(user_id)
+        for channel_id, flag in db.execute("SELECT channel_id, flag FROM channel_flags WHERE guild_id = ?", (g,)):
+            self.channels.setdefault(flag, set()).add(channel_id)
+        self.nicknames = dict(db.execute("SELECT user_id, nick FROM nicknames WHERE guild_id = ?", (g,)))
+        self.flags = {flag for (flag,) in db.execute("SELECT flag FROM guild_flags WHERE guild_id = ?", (g,))}
+        return self
+
+
+class BotStore:
+    """
+    SQLite (WAL mode) store for per-server bot state.
+
+    Each server's rows are loaded the first time that server is touched, so
+    startup costs the same however many servers the bot is in. Changes are
+    queued as row-level statements and committed together on a worker thread
+    shortly after a burst ends (see DebouncedSaver).
+    """
+
+    def __init__(self, path=DB_FILE, delay=SAVE_DELAY):
+        self.path = path
+        self.db = self._connect()  # Reads, on the event loop thread
+        self.db.executescript(SCHEMA)
+        self.writer = None         # Writes, on the saver's worker thread (opened there on first use)
+        self.pending = []
+        self.guilds = {}
+        self.listeners = []  # Called with a guild_id (GLOBAL meaning "every server") after its flags change
+        self.saver = DebouncedSaver(self._take_pending, self._write, delay, name=path, restore=self._restore_pending)
+        self.global_state = GuildState(self, GLOBAL).load(self.db)
+
+    def _connect(self):
+        # Several shard processes may share one file, so wait for their writes instead of failing
+        db = sqlite3.connect(self.path, timeout=10, check_same_thread=False)
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute("PRAGMA synchronous=NORMAL")
+        return db
+
+    def guild(self, guild_id):
+        """State for one server (GLOBAL entries only when guild_id is None, e.g. in DMs)."""
+        if guild_id is None: return self.global_state
+        state = self.guilds.get(guild_id)
+        if state is None:
+            state = self.guilds[guild_id] = GuildState(self, guild_id, self.global_state).load(self.db)
+        return state
+
+    def changed(self, guild_id):
+        for listener in self.listeners:
+            listener(guild_id)
+
+    def reload_global(self):
+        """Re-reads the GLOBAL rows, picking up changes other shard processes made."""
+        self.global_state.load(self.db)
+        self.changed(GLOBAL)
+
+    def queue(self, sql, params):
+        self.pending.append((sql, params))
+        self.saver.mark_dirty()
+
+    def _take_pending(self):
+        ops, self.pending = self.pending, []
+        return ops
+
+    def _restore_pending(self, ops):
+        # The transaction rolled back; retry these before anything queued since
+        self.pending[:0] = ops
+
+    def _write(self, ops):
+        if self.writer is None: self.writer = self._connect()
+        with self.writer:
+            for sql, params in ops:
+                self.writer.execute(sql, params)
+
+    async def flush(self):
+        await self.saver.flush()
+
+    def close(self):
+        if self.writer: self.writer.close()
+        self.db.close()
+
+    def get_meta(self, key, default=None):
+        row = self.db.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else default
+
+    def set_meta(self, key, value):
+        self.queue("INSERT OR REPLACE INTO meta VALUES (?, ?)", (key, str(value)))
+
+    def totals(self):
+        """Row counts for the startup banner (indexed COUNTs, no rows are loaded)."""
+        q = lambda sql, *p: self.db.execute(sql, p).fetchone()[0]
+        return {
+            "admins": q("SELECT COUNT(*) FROM member_flags WHERE flag = ?", ADMIN),
+            "names": q("SELECT COUNT(*) FROM nicknames"),
+            "servers": q("SELECT COUNT(*) FROM guild_flags WHERE flag = ?", NAMES_ENFORCED),
+        }
+
+    def migrate_json(self, data_file, names_file):
+        """
+        One-off import of the old bot_data.json / names.json. The JSON files had no
+        server information, so members, channels and names become GLOBAL entries
+        (they keep applying everywhere, as before). The files are renamed to
+        *.migrated afterwards. Returns True if anything was imported.
+        """
+        if self.get_meta("json_migrated") or not (os.path.exists(data_file) or os.path.exists(names_file)):
+            return False
+        data, names = {}, {}
+        try:
+            with open(data_file) as f: data = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError): pass
+        try:
+            with open(names_file) as f: names = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError): pass
+
+        member_keys = {"voicebanned_members": VOICEBANNED, "muted_members": MUTED, "admins": ADMIN,
+                       "enabled_name_enforcements": NAME_ON, "disabled_name_enforcements": NAME_OFF}
+        channel_keys = {"reddit_mode_channels": REDDIT, "smash_or_pass_channels": SMASH_OR_PASS}
+        with self.db:
+            for key, flag in member_keys.items():
+                self.db.executemany("INSERT OR IGNORE INTO member_flags VALUES (?, ?, ?)", [(GLOBAL, int(u), flag) for u in data.get(key, [])])
+            for key, flag in channel_keys.items():
+                self.db.executemany("INSERT OR IGNORE INTO channel_flags VALUES (?, ?, ?)", [(GLOBAL, int(c), flag) for c in data.get(key, [])])
+            self.db.executemany("INSERT OR IGNORE INTO guild_flags VALUES (?, ?)", [(int(g), NAMES_ENFORCED) for g in data.get("name_enforced_guilds", [])])
+            self.db.executemany("INSERT OR REPLACE INTO nicknames VALUES (?, ?, ?)", [(GLOBAL, int(u), n) for u, n in names.items()])
+            self.db.execute("INSERT OR REPLACE INTO meta VALUES ('json_migrated', '1')")
+
+        for path in (data_file, names_file):
+            if os.path.exists(path): os.replace(path, path + ".migrated")
+        self.guilds.clear()
+        self.reload_global()
+        return True
@@ -0,0 +1,79 @@
+import itertools
+import math
+import pytest
+import dice
+
+# ==========================================
+# BRUTE FORCE
+# ==========================================
+BRUTE_DEPTH = 35  # Rerolls followed per exploding die; longer chains (< 3^-35) are dropped
+
+
+def faces_of(sides, explode):
+    """(total, probability) of one die, following every reroll chain roll by roll."""
+    faces, chains = [], [(0, 1.0)]
+    for _ in range(BRUTE_DEPTH if explode else 1):
+        rerolls = []
+        for total, p in chains:
+            for roll in range(1, sides + 1):
+                if explode and roll == sides: rerolls.append((total + roll, p / sides))
+                else: faces.append((total + roll, p / sides))
+        chains = rerolls
+    return faces
+
+
+def brute(text, rule="normal"):
+    """Every outcome of every die enumerated, as {total: probability}."""
+    expression = dice.compile_expression(text)
+    per_term = []
+    for term in expression.terms:
+        faces = faces_of(term.sides, term.explode)
+        outcomes = {}
+        for combo in itertools.product(faces, repeat=term.count):
+            rolls = sorted((v for v, _ in combo), reverse=term.keep == "kh")
+            kept = rolls[:term.keep_count] if term.keep else rolls
+            total = term.sign * sum(kept)
+            outcomes[total] = outcomes.get(total, 0) + math.prod(p for _, p in combo)
+        per_term.append(outcomes)
+    totals = {expression.modifier: 1.0}
+    for outcomes in per_term:
+        nxt = {}
+        for a, pa in totals.items():
+            for b, pb in outcomes.items():
+                nxt[a + b] = nxt.get(a + b, 0) + pa * pb
+        totals = nxt
+    if rule != "normal":
+        pick = max if rule == "adv" else min
+        pairs = {}
+        for (a, pa), (b, pb) in itertools.product(totals.items(), repeat=2):
+            pairs[pick(a, b)] = pairs.get(pick(a, b), 0) + pa * pb
+        totals = pairs
+    return totals
+
+
+# ==========================================
+# TESTS
+# ==========================================
+CASES = [("3d6", "normal"), ("4d6kh3", "normal"), ("4d6kl2", "normal"), ("2d6+1d4+3", "normal"),
+         ("1d8-1d4", "normal"), ("3d4k2+2", "normal"), ("1d20+5", "adv"), ("1d20+5", "dis"),
+         ("2d3!", "normal"), ("3d3!kh2", "normal"), ("d%-10", "normal"), ("2d6-3", "adv")]
+
+
+@pytest.mark.parametrize("text, rule", CASES)
+def test_distribution_matches_brute_force(text, rule):
+    exact, expected = dice.distribution(text, rule), brute(text, rule)
+    assert abs(exact.probs.sum() - 1) < 1e-9
+    for total in set(expected) | set(exact.values.tolist()):
+        assert exact.prob(total) == pytest.approx(expected.get(total, 0.0), abs=1e-12), f"P({total})"
+    assert exact.mean == pytest.approx(sum(t * p for t, p in expected.items()), abs=1e-9)
+
+
+def test_distribution_cache():
+    # Equivalent spellings share one entry and repeats are hits
+    dice._distribution.cache_clear()
+    first = dice.distribution("4d6kh3+2")
+    assert dice.distribution(" 4D6 KH3 + 2 ") is first
+    info = dice._distribution.cache_info()
+    assert (info.hits, info.misses) == (1, 1)
+    assert dice.distribution("4d6kh3+2", "adv") is not first
+    assert dice._distribution.cache_info().misses == 2